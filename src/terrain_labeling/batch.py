@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from core.database import Database
+from core.export import build_tile_export
+from core.profiling import tracer
+from ml.image_io import DecodedImage
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+
+# Per-process models, created once by _init_worker
+_label_selector = None
+_tile_generator = None
+
+def _init_worker(threads, backend, tile_options):
+    global _label_selector, _tile_generator
+    import torch
+    from ml.label_selector import LabelSelector
+    from ml.tile_generator import TileGenerator
+
+    if threads:
+        torch.set_num_threads(threads)
+    _label_selector = LabelSelector(backend)
+    _tile_generator = TileGenerator(**tile_options, backend=backend)
+    _label_selector._load_model()
+    _tile_generator._load_models()
+
+def _process_images(job):
+    # Runs analyze -> generate for a few images: their crops share CLIP batches
+    # (analyze_many), then each is tiled as soon as its labels are known. A
+    # failing image is reported in its result rather than failing the others.
+    # The caches are filled in place and sent back so the main process (the
+    # only one with the database) stores them.
+    settings = job["settings"]
+    # One decode per image, shared by analysis and generation
+    images = [DecodedImage(item["data"], name=item["name"]) for item in job["images"]]
+
+    results = []
+    analyses = _label_selector.analyze_many(images, job["label_names"], settings["prompt"],
+                                            settings["top_k"], settings["threshold"],
+                                            text_cache=job["text_cache"])
+    for item, (image, labels) in zip(job["images"], analyses):
+        result = {"name": item["name"], "labels": labels, "tile_data": None, "map_cache": {}, "error": None}
+        results.append(result)
+        if labels is None:
+            result["error"] = "could not decode the image"
+            continue
+        label_names = [l['name'] if isinstance(l, dict) else l for l in labels]
+        if not label_names:
+            continue
+        try:
+            result["map_cache"] = item["map_caches"].get(tuple(label_names), {})
+            result["tile_data"] = _tile_generator.generate(
+                image, label_names, settings["rows"], settings["cols"], label_configs=job["label_configs"],
+                walkability_threshold=settings["walkability_threshold"], map_cache=result["map_cache"])
+            if not result["tile_data"]:
+                result["error"] = "tile generation failed"
+        except Exception as e:
+            result["error"] = str(e)
+
+    # This job's spans, tagged with the worker's pid so the merged trace keeps
+    # one track per process (thread idents are only unique within a process)
+    pid = os.getpid()
+    trace = [(name, start, duration, pid, f"worker-{pid}", args)
+             for name, start, duration, _, _, args in tracer.events]
+    tracer.clear()
+
+    return {"results": results, "text_cache": job["text_cache"], "trace": trace}
+
+def ingest(db, directory):
+    names = []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not filename.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            data_hash = hashlib.sha256(f.read()).hexdigest()
+        img_model = db.get_image(filename)
+        if img_model is None or img_model.data_hash != data_hash:
+            try:
+                db.add_image(path)
+            except OSError as e:
+                print(f"Skipped {filename}: {e}")
+                continue
+            print(f"Ingested {filename}")
+        names.append(filename)
+    return names
+
+def run_id_for(settings, label_configs, model_ids):
+    key = json.dumps([settings, sorted(label_configs.items()), list(model_ids)], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+def _store_result(db, result, settings, label_configs, model_ids, export_dir):
+    name = result["name"]
+    config = {"top_k": settings["top_k"], "threshold": settings["threshold"], "prompt": settings["prompt"]}
+
+    db.update_image_analysis(name, result["labels"], config)
+
+    tile_data = result["tile_data"]
+    if tile_data:
+        label_names = [l['name'] if isinstance(l, dict) else l for l in result["labels"]]
+        db.store_inference_maps(name, label_names, model_ids["tiles"], result["map_cache"])
+        db.update_image_tile_data(name, tile_data)
+
+        if export_dir:
+            export_data = build_tile_export(db.get_image(name).tile_data, db.get_all_labels())
+            with open(os.path.join(export_dir, os.path.splitext(name)[0] + ".json"), 'w') as f:
+                json.dump(export_data, f, indent=4)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label and tile map images without the UI.")
+    parser.add_argument("--input", help="Directory of images to ingest and process (default: every image in the database)")
+    parser.add_argument("--db", help="Database file (default: mydata.fs next to main.py)")
+    parser.add_argument("--export-dir", help="Write one JSON export per image into this directory")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each loading the models once")
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument("--images-per-job", type=int, default=8,
+                        help="Images handed to a worker at once; their CLIP crops are encoded in shared batches")
+    parser.add_argument("--run", help="Checkpoint name; rerunning with the same name resumes (default: derived from the settings)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--prompt", default="a top-down rpg map texture of {}")
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--walkability-threshold", type=float, default=0.4)
+    parser.add_argument("--window-size", type=int, default=None, help="Segment large maps in windows of this many pixels")
+    parser.add_argument("--trace", help="Write a Chrome trace (chrome://tracing, Perfetto) of the run to this file")
+    parser.add_argument("--backend", help="Inference backend: fp32 or int8 (default: $TERRAIN_BACKEND or fp32)")
+    args = parser.parse_args(argv)
+
+    if "{}" not in args.prompt:
+        parser.error("--prompt must contain '{}' placeholder")
+
+    from ml.label_selector import LabelSelector
+    from ml.tile_generator import TileGenerator
+
+    settings = {
+        "top_k": args.top_k, "threshold": args.threshold, "prompt": args.prompt,
+        "rows": max(1, min(args.rows, 100)), "cols": max(1, min(args.cols, 100)),
+        "walkability_threshold": args.walkability_threshold,
+    }
+    tile_options = {"window_size": args.window_size}
+    try:
+        model_ids = {"clip": LabelSelector(args.backend).feature_id,
+                     "tiles": TileGenerator(**tile_options, backend=args.backend).inference_id()}
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.trace:
+        tracer.set_capacity(None)
+
+    db = Database(args.db)
+    try:
+        names = ingest(db, args.input) if args.input else db.get_image_names()
+
+        all_labels = db.get_all_labels()
+        label_names = [l.name for l in all_labels]
+        label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
+
+        run_id = args.run or run_id_for(settings, label_configs, model_ids["tiles"])
+        done = db.get_batch_progress(run_id)
+        pending = [name for name in names if done.get(name) != db.get_image(name).data_hash]
+        print(f"Run {run_id}: {len(names) - len(pending)} of {len(names)} images already done, {len(pending)} to process")
+        if not pending:
+            return 0
+
+        if args.export_dir:
+            os.makedirs(args.export_dir, exist_ok=True)
+
+        workers = max(1, args.workers)
+        threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+        text_cache = db.get_text_feature_cache(model_ids["clip"], args.prompt)
+
+        def make_job(names):
+            items = []
+            for name in names:
+                img_model = db.get_image(name)
+                # Cached maps for the label sets this image was already tiled with
+                map_caches = {}
+                previous = [l['name'] if isinstance(l, dict) else l for l in img_model.relevant_labels or []]
+                if previous:
+                    map_caches[tuple(previous)] = db.get_inference_maps(name, previous, model_ids["tiles"])
+                items.append({"name": name, "data": img_model.data, "map_caches": map_caches})
+            return {
+                "images": items,
+                "label_names": label_names,
+                "label_configs": label_configs,
+                "settings": settings,
+                "text_cache": dict(text_cache),
+            }
+
+        # Fewer images per job when there are too few to keep every worker busy
+        per_job = max(1, min(args.images_per_job, -(-len(pending) // workers)))
+        chunks = iter([pending[i:i + per_job] for i in range(0, len(pending), per_job)])
+
+        failed = 0
+        count = 0
+        start = time.perf_counter()
+        # spawn: workers must not inherit the parent's torch or ZODB state
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(threads, args.backend, tile_options)) as pool:
+            running = {}
+
+            def submit(names):
+                # A worker that crashed breaks the pool, which then refuses new
+                # jobs; those images are reported as failed like any other error
+                # so the run finishes with its checkpoint of the completed maps.
+                try:
+                    future = pool.submit(_process_images, make_job(names))
+                except Exception as e:
+                    future = Future()
+                    future.set_exception(e)
+                running[future] = names
+
+            # Keep a couple of jobs per worker in flight rather than every image in memory
+            for names in itertools.islice(chunks, workers * 2):
+                submit(names)
+
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    names = running.pop(future)
+                    try:
+                        output = future.result()
+                        tracer.events.extend(output["trace"])
+                        db.store_text_features(model_ids["clip"], settings["prompt"], output["text_cache"])
+                        text_cache.update(output["text_cache"])
+                        results = output["results"]
+                    except Exception as e:
+                        results = [{"name": name, "error": str(e)} for name in names]
+
+                    for result in results:
+                        name = result["name"]
+                        count += 1
+                        try:
+                            if result["error"]:
+                                raise RuntimeError(result["error"])
+                            _store_result(db, result, settings, label_configs, model_ids, args.export_dir)
+                            db.mark_batch_done(run_id, name)
+                            status = f"{len(result['labels'])} labels"
+                            if result["tile_data"]:
+                                status += f", {len(result['tile_data']['grid'])} tiles"
+                        except Exception as e:
+                            failed += 1
+                            status = f"FAILED ({e})"
+
+                        elapsed = time.perf_counter() - start
+                        print(f"[{count}/{len(pending)}] {name}: {status} - {count / elapsed * 60:.1f} maps/min")
+
+                    for next_names in itertools.islice(chunks, 1):
+                        submit(next_names)
+
+        elapsed = time.perf_counter() - start
+        processed = len(pending) - failed
+        print(f"Processed {processed} maps in {elapsed:.1f}s ({processed / elapsed * 60:.1f} maps/min), {failed} failed")
+        return 1 if failed else 0
+    finally:
+        db.close()
+        if args.trace:
+            tracer.export_chrome_trace(args.trace)
+            print(f"Trace written to {args.trace}")
+
+if __name__ == "__main__":
+    raise SystemExit(main())
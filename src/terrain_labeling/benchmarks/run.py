@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Real-model mode only uses weights that are already cached locally
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# (image sizes, label counts, tile grids)
+FULL_CASES = ((512, 1024, 2048), (5, 12), (20, 50, 100))
+QUICK_CASES = ((512,), (5,), (20,))
+
+PREVIEW_SIZE = 600   # DetailView's preview thumbnail
+WALKABILITY_THRESHOLD = 0.4
+
+def measure(fn, repeat, warmup=1):
+    # Model and library prints are noise here
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            fn()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "runs": repeat}
+
+def machine_info(mode):
+    import torch
+    return {
+        "mode": mode,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+    }
+
+
+class Suite:
+    def __init__(self, generator, mode, cases, repeat, name_filter=None):
+        self.generator = generator
+        self.mode = mode
+        self.sizes, self.label_counts, self.grids = cases
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.results = {}
+
+    def bench(self, name, fn, repeat=None, spans=False):
+        if self.name_filter and self.name_filter not in name:
+            return
+        from core.profiling import tracer
+
+        tracer.clear()
+        result = measure(fn, repeat or self.repeat)
+        if spans and tracer.enabled:
+            # Where the time went, from the spans recorded in the timed runs
+            result["spans"] = {span: round(entry["mean_ms"], 3) for span, entry in tracer.stats().items()}
+        self.results[name] = result
+        print(f"  {name:<48} {result['median_ms']:>10.2f} ms  (min {result['min_ms']:.2f})")
+
+    def run(self):
+        from benchmarks.synthetic import make_battlemap, make_labels
+
+        for size in self.sizes:
+            for num_labels in self.label_counts:
+                labels, label_configs = make_labels(num_labels)
+                image, _ = make_battlemap(size, labels, seed=size + num_labels)
+                self.run_map(image, f"{size}px/{num_labels}labels", labels, label_configs)
+
+    def run_map(self, image, case, labels, label_configs):
+        generator = self.generator
+        print(f"{case}:")
+
+        # Full pipeline at the default grid; models are stubs unless --real
+        self.bench(f"generate[{self.mode}]/{case}",
+                   lambda: generator.generate(image, labels, 20, 20, label_configs, WALKABILITY_THRESHOLD),
+                   spans=True)
+
+        map_cache = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.generate(image, labels, 20, 20, label_configs, WALKABILITY_THRESHOLD, map_cache=map_cache)
+        mat_map, slope_map = generator._unpack_maps(map_cache["maps"])
+
+        self.bench(f"render_maps/{case}", lambda: generator._render_maps(mat_map, slope_map, labels))
+
+        preview = image.resize((PREVIEW_SIZE, PREVIEW_SIZE))
+        for grid_size in self.grids:
+            # Cached inference maps: only the tiling is redone
+            self.bench(f"tiling/{case}/{grid_size}x{grid_size}",
+                       lambda: generator.generate(image, labels, grid_size, grid_size, label_configs,
+                                                  WALKABILITY_THRESHOLD, map_cache=map_cache))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                tile_data = generator.generate(image, labels, grid_size, grid_size, label_configs,
+                                               WALKABILITY_THRESHOLD, map_cache=map_cache)
+            self.run_grid(f"{case}/{grid_size}x{grid_size}", tile_data, preview, label_configs)
+
+    def run_grid(self, case, tile_data, preview, label_configs):
+        from ml import tile_logic
+        from ui.tile_preview import TilePreviewRenderer
+
+        grid = tile_data["grid"]
+        rows, cols = grid.shape
+        tiles = [(grid.tile_composition(c, r), float(grid.slope[r, c]))
+                 for r in range(rows) for c in range(cols)]
+        self.bench(f"analyze_tile_logic/{case}",
+                   lambda: [tile_logic.analyze_tile_logic(composition, slope, label_configs, WALKABILITY_THRESHOLD)
+                            for composition, slope in tiles])
+        self.bench(f"evaluate_grid/{case}",
+                   lambda: tile_logic.evaluate_grid(grid.composition, grid.slope, grid.labels, label_configs,
+                                                    WALKABILITY_THRESHOLD))
+
+        # DetailView preview: a fresh overlay (new tile data or label config)
+        # and a hover over the cached one
+        renderer = TilePreviewRenderer(tile_logic.evaluate_grid)
+
+        def render_overlay():
+            renderer.reset(preview, grid)
+            renderer.render(WALKABILITY_THRESHOLD, label_configs, 0)
+
+        self.bench(f"overlay/{case}", render_overlay)
+        renderer.reset(preview, grid)
+        self.bench(f"overlay_hover/{case}",
+                   lambda: renderer.render(WALKABILITY_THRESHOLD, label_configs, 0, highlight=(rows // 2, cols // 2)))
+
+        self.run_database(case, tile_data, preview)
+
+    def run_database(self, case, tile_data, preview):
+        from core.database import Database
+
+        db_dir = tempfile.mkdtemp(prefix="terrain-bench-")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                db = Database(os.path.join(db_dir, "bench.fs"))
+            try:
+                image_path = os.path.join(db_dir, "map.png")
+                preview.save(image_path)
+                name = db.add_image(image_path)
+                # Each run rewrites the image's tile data and commits it
+                self.bench(f"db_tile_data/{case}", lambda: db.update_image_tile_data(name, tile_data))
+            finally:
+                db.close()
+        finally:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    # Names slower than the baseline by more than tolerance (and min_delta_ms).
+    # Best-of-N times are compared: they are far less noisy than medians.
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        delta = result["min_ms"] - base["min_ms"]
+        ratio = result["min_ms"] / max(base["min_ms"], 1e-9)
+        if ratio > 1 + tolerance and delta > min_delta_ms:
+            regressions.append(name)
+            marker = "REGRESSION"
+        elif ratio < 1 - tolerance and -delta > min_delta_ms:
+            marker = "faster"
+        else:
+            marker = ""
+        print(f"  {name:<48} {base['min_ms']:>10.2f} -> {result['min_ms']:>10.2f} ms  {ratio:>5.2f}x  {marker}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time tiling, map rendering, tile logic, database commits and "
+                                                 "preview overlays on synthetic battlemaps.")
+    parser.add_argument("--quick", action="store_true", help="One small map instead of the full size/label/grid matrix")
+    parser.add_argument("--real", action="store_true",
+                        help="Use the real CLIPSeg and depth models (weights must already be cached locally)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (after one warm-up run)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Baseline JSON to compare against; written if it does not exist yet")
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--output", help="Also write this run's results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown of the best time that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore slowdowns smaller than this, however large relatively")
+    args = parser.parse_args(argv)
+
+    mode = "real" if args.real else "stub"
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.real:
+            from ml.tile_generator import TileGenerator
+            generator = TileGenerator()
+        else:
+            from benchmarks.stub_models import StubTileGenerator
+            generator = StubTileGenerator()
+        try:
+            generator._load_models()
+        except Exception as e:
+            print(f"Could not load the models ({e}). Real-model mode needs the CLIPSeg and depth weights in the "
+                  f"local Hugging Face cache; run the app once online first.", file=sys.stderr)
+            return 2
+
+    suite = Suite(generator, mode, QUICK_CASES if args.quick else FULL_CASES, args.repeat, args.filter)
+    suite.run()
+    report = {"meta": machine_info(mode), "results": suite.results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"Compared with {args.baseline}:")
+    changed = [key for key, value in report["meta"].items() if baseline["meta"].get(key) != value]
+    if changed:
+        print(f"  Note: baseline was recorded with a different {', '.join(changed)}")
+    regressions = compare(suite.results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
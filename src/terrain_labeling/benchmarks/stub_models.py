@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from ml.palette import label_palette
+from ml.tile_generator import TileGenerator
+from benchmarks.synthetic import make_depth
+
+# Deterministic stand-ins for CLIPSeg and Depth-Anything. They never download
+# weights, return outputs of the real models' shapes and dtypes, and cost
+# little enough that the benchmarks time the code around the models.
+
+SEGMENT_SIZE = 352   # CLIPSeg's output resolution
+
+def _stub_depth(images, batch_size=None):
+    # Same calling convention as the transformers depth-estimation pipeline
+    if isinstance(images, list):
+        return [{"depth": make_depth(image)} for image in images]
+    return {"depth": make_depth(images)}
+
+
+class StubTileGenerator(TileGenerator):
+    SEGMENT_MODEL_ID = "stub/segment"
+    DEPTH_MODEL_ID = "stub/depth"
+    MODEL_IDS = (SEGMENT_MODEL_ID, DEPTH_MODEL_ID)
+
+    def _load_models(self):
+        self.depth_pipe = _stub_depth
+
+    def _segment_logits(self, images, labels):
+        # Logits fall off with the distance of each (downscaled) pixel from the
+        # label's palette colour, so synthetic maps segment into their regions
+        colors = torch.from_numpy(label_palette(labels)).float()
+        logits = []
+        for image in images:
+            small = image.resize((SEGMENT_SIZE, SEGMENT_SIZE), Image.BILINEAR)
+            pixels = torch.from_numpy(np.asarray(small, dtype=np.float32))
+            distance = ((pixels[None] - colors[:, None, None]) ** 2).sum(dim=-1)
+            logits.append(-distance / 1000.0)
+        return torch.stack(logits)
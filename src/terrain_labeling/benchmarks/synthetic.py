@@ -0,0 +1,56 @@
+import numpy as np
+from PIL import Image, ImageFilter
+
+from ml.palette import label_palette
+
+# Synthetic battlemaps for the benchmarks: Voronoi regions of labels painted in
+# each label's palette colour, with texture noise and shading from a smooth
+# height field. Everything derives from the seed, so a given (size, labels,
+# seed) is the same map on every machine.
+
+DEFAULT_LABELS = {
+    "grass":           {"walkable": True,  "slope_tolerance": 0.4},
+    "dirt path":       {"walkable": True,  "slope_tolerance": 0.6},
+    "rock wall":       {"walkable": False, "slope_tolerance": 0.1},
+    "water":           {"walkable": False, "slope_tolerance": 0.1},
+    "tree vegetation": {"walkable": False, "slope_tolerance": 0.1},
+}
+
+def make_labels(num_labels):
+    # The default database labels first, then generated ones
+    label_configs = dict(list(DEFAULT_LABELS.items())[:num_labels])
+    for i in range(len(label_configs), num_labels):
+        label_configs[f"terrain {i}"] = {"walkable": i % 2 == 0, "slope_tolerance": round(0.1 + 0.1 * (i % 5), 1)}
+    return list(label_configs), label_configs
+
+def _smooth_field(rng, size, cells):
+    coarse = rng.random((cells, cells)).astype(np.float32)
+    field = Image.fromarray(coarse, mode="F").resize((size, size), Image.BICUBIC)
+    return np.asarray(field)
+
+def make_battlemap(size, labels, seed=0):
+    # Returns the RGB map and its ground-truth label-index map
+    rng = np.random.default_rng(seed)
+
+    # Regions are laid out on a coarse grid and upscaled, which keeps
+    # generation fast for large maps and gives blocky, map-like borders
+    coarse = max(16, size // 8)
+    num_seeds = 4 * len(labels)
+    points = rng.random((num_seeds, 2)) * coarse
+    point_labels = np.arange(num_seeds) % len(labels)
+    yy, xx = np.mgrid[0:coarse, 0:coarse]
+    distance = (yy[..., None] - points[:, 0]) ** 2 + (xx[..., None] - points[:, 1]) ** 2
+    coarse_truth = point_labels[np.argmin(distance, axis=-1)].astype(np.uint8)
+    truth = np.asarray(Image.fromarray(coarse_truth).resize((size, size), Image.NEAREST))
+
+    colors = label_palette(labels).astype(np.float32)
+    height = _smooth_field(rng, size, 6)
+    shading = 0.75 + 0.5 * height[..., None]
+    noise = rng.normal(0.0, 10.0, (size, size, 3)).astype(np.float32)
+    pixels = np.clip(colors[truth] * shading + noise, 0, 255).astype(np.uint8)
+
+    return Image.fromarray(pixels), truth
+
+def make_depth(image):
+    # Stand-in depth estimate: smoothed luminance, which follows the shading
+    return image.convert("L").filter(ImageFilter.GaussianBlur(4))
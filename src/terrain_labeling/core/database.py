@@ -3,12 +3,30 @@ import persistent
 from BTrees.OOBTree import OOBTree
 import transaction
 import os
+import sys
 from PIL import Image
 import io
-from core.models import ImageModel, LabelConfig
+import hashlib
+import time
+from ZODB.blob import Blob
+from core.models import ImageModel, LabelConfig, read_blob
+from core.profiling import span
 
 ImageModel = ImageModel
 LabelConfig = LabelConfig
+# Databases from before the core package pickled these classes as db.*; the
+# alias lets every entry point (app, batch, tools) open them
+sys.modules.setdefault('db', sys.modules[__name__])
+
+# Gallery and detail-view preview sizes, generated once per image
+THUMBNAIL_SIZES = (150, 600)
+
+# Cached inference maps kept per image content; older entries are evicted
+INFERENCE_MAPS_PER_IMAGE = 4
+
+# Stored on the root; databases below it are migrated once on open.
+# 1: image data and maps in blobs, without copies of the source image
+SCHEMA_VERSION = 1
 
 class Database:
     def __init__(self, db_path=None):
@@ -17,10 +35,13 @@ class Database:
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             db_path = os.path.join(base_dir, "mydata.fs")
             
-        self.storage = ZODB.FileStorage.FileStorage(db_path)
+        blob_dir = os.path.splitext(db_path)[0] + ".blobs"
+        self.storage = ZODB.FileStorage.FileStorage(db_path, blob_dir=blob_dir)
         self.db = ZODB.DB(self.storage)
         self.connection = self.db.open()
         self.root = self.connection.root()
+        # Bumped on every label change so views can cache label configs
+        self.labels_version = 0
 
         if not hasattr(self.root, 'images'):
             self.root.images = OOBTree()
@@ -28,9 +49,66 @@ class Database:
         if not hasattr(self.root, 'labels'):
             self.root.labels = OOBTree()
             self._init_default_labels()
+
+        if not hasattr(self.root, 'text_features'):
+            # (model_id, prompt_template) -> OOBTree(label name -> text feature)
+            self.root.text_features = OOBTree()
+
+        if not hasattr(self.root, 'inference_maps'):
+            # (image hash, labels, model ids) -> packed mat/slope maps + renders
+            self.root.inference_maps = OOBTree()
+
+        if not hasattr(self.root, 'batch_runs'):
+            # batch run id -> OOBTree(image name -> content hash when finished)
+            self.root.batch_runs = OOBTree()
+
+        if getattr(self.root, 'schema_version', 0) < SCHEMA_VERSION:
+            self._migrate_to_blobs()
+            self.root.schema_version = SCHEMA_VERSION
             
         transaction.commit()
 
+    def _commit(self, op):
+        with span("db.commit", op=op):
+            transaction.commit()
+
+    def _migrate_to_blobs(self):
+        # Move payloads of records written before blob storage out of the pickles
+        for img_model in self.root.images.values():
+            if getattr(img_model, 'blob', None) is None:
+                data = img_model.__dict__.pop('data')
+                img_model.data_hash = hashlib.sha256(data).hexdigest()
+                img_model.blob = Blob(data)
+                img_model.maps = {}
+            if img_model.tile_data and 'maps' in img_model.tile_data:
+                self._store_maps(img_model, img_model.tile_data)
+            elif 'original' in (getattr(img_model, 'maps', None) or {}):
+                img_model.maps = {k: v for k, v in img_model.maps.items() if k != "original"}
+
+        for key, cached in list(self.root.inference_maps.items()):
+            if isinstance(cached.get("maps"), bytes):
+                self.root.inference_maps[key] = self._to_blobs(cached)
+            elif "original" in cached.get("renders", {}):
+                self.root.inference_maps[key] = {
+                    "maps": cached["maps"],
+                    "renders": {k: v for k, v in cached["renders"].items() if k != "original"},
+                }
+
+    @staticmethod
+    def _to_blobs(map_cache):
+        # Renders from older versions include a copy of the source image,
+        # which is not kept: get_image_map serves the image blob as "original"
+        return {
+            "maps": Blob(map_cache["maps"]),
+            "renders": {k: Blob(v) for k, v in map_cache.get("renders", {}).items() if k != "original"},
+        }
+
+    def _store_maps(self, img_model, tile_data):
+        # Rendered PNG maps are kept as blobs on the image, not inside tile_data
+        # (minus any legacy copy of the source image, as in _to_blobs)
+        maps = tile_data.pop('maps', None) or {}
+        img_model.maps = {k: Blob(v) for k, v in maps.items() if k != "original"}
+
     def _init_default_labels(self):
         defaults = {
             "grass":       {"walkable": True,  "slope_tolerance": 0.4},
@@ -48,43 +126,175 @@ class Database:
         with open(image_path, "rb") as f:
             image_data = f.read()
         image_model = ImageModel(filename, image_data)
+        image_model.data_hash = hashlib.sha256(image_data).hexdigest()
+        image_model.thumbnails = self._make_thumbnails(image_data)
         self.root.images[filename] = image_model
-        transaction.commit()
+        self._commit("add_image")
         return filename
 
     def delete_image(self, name):
         if name in self.root.images:
+            data_hash = self._content_hash(self.root.images[name])
             del self.root.images[name]
-            transaction.commit()
+            if not any(getattr(img, 'data_hash', None) == data_hash for img in self.root.images.values()):
+                self._drop_inference_maps(data_hash)
+            self._commit("delete_image")
             return True
         return False
 
     def get_all_images(self):
         return list(self.root.images.values())
     
+    def get_image_names(self):
+        return list(self.root.images.keys())
+
     def get_image(self, name):
         return self.root.images.get(name)
 
+    def get_image_file(self, name):
+        # Path of the committed image blob, so other threads can read the
+        # bytes without going through this (Tk thread's) connection
+        img_model = self.root.images.get(name)
+        return img_model.blob.committed() if img_model is not None else None
+
+    @staticmethod
+    def _make_thumbnails(image_data):
+        image = Image.open(io.BytesIO(image_data)).convert("RGB")
+        thumbnails = {}
+        # Largest first, each level is downscaled from the previous one
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            image.thumbnail((size, size))
+            with io.BytesIO() as bio:
+                image.save(bio, format="JPEG", quality=90)
+                thumbnails[size] = Blob(bio.getvalue())
+        return thumbnails
+
+    def get_thumbnail(self, name, size):
+        img_model = self.root.images.get(name)
+        if img_model is None:
+            return None
+        if not getattr(img_model, 'thumbnails', None):
+            # Images uploaded before thumbnails existed get them on first view
+            img_model.thumbnails = self._make_thumbnails(img_model.data)
+            self._commit("get_thumbnail")
+        return read_blob(img_model.thumbnails[size])
+
+    def get_image_map(self, name, key):
+        img_model = self.root.images.get(name)
+        if key == "original" and img_model is not None:
+            return img_model.data
+        maps = getattr(img_model, 'maps', None) or {}
+        if key not in maps:
+            return None
+        return read_blob(maps[key])
+
     def update_image_analysis(self, name, relevant_labels, config):
         if name in self.root.images:
             img_model = self.root.images[name]
             img_model.relevant_labels = relevant_labels
             img_model.analysis_config = config
             img_model._p_changed = True
-            transaction.commit()
+            self._drop_stale_inference_maps(self._content_hash(img_model))
+            self._commit("update_image_analysis")
+
+    def _content_hash(self, img_model):
+        # Images stored before hashing was introduced get theirs on first use
+        if getattr(img_model, 'data_hash', None) is None:
+            img_model.data_hash = hashlib.sha256(img_model.data).hexdigest()
+        return img_model.data_hash
+
+    def get_image_feature_cache(self, name, model_id):
+        img_model = self.root.images.get(name)
+        if img_model is None:
+            return {}
+        cached = getattr(img_model, 'image_features', None)
+        if cached and cached.get("key") == (self._content_hash(img_model), model_id):
+            return {"features": cached["features"]}
+        return {}
+
+    def store_image_features(self, name, model_id, image_cache):
+        if name in self.root.images and "features" in image_cache:
+            img_model = self.root.images[name]
+            img_model.image_features = {
+                "key": (self._content_hash(img_model), model_id),
+                "features": image_cache["features"],
+            }
+            self._commit("store_image_features")
+
+    def _inference_map_keys(self, data_hash):
+        # Keys sort by hash first; (hash + "\0",) is the first key past it
+        return list(self.root.inference_maps.keys(min=(data_hash,), max=(data_hash + "\0",)))
+
+    def _drop_inference_maps(self, data_hash):
+        for key in self._inference_map_keys(data_hash):
+            del self.root.inference_maps[key]
+
+    def _drop_stale_inference_maps(self, data_hash):
+        # Maps are generated for an image's relevant labels, so entries for
+        # label lists no image with this content has any more are never read
+        in_use = {tuple(l['name'] if isinstance(l, dict) else l for l in img.relevant_labels or [])
+                  for img in self.root.images.values() if getattr(img, 'data_hash', None) == data_hash}
+        for key in self._inference_map_keys(data_hash):
+            if key[1] not in in_use:
+                del self.root.inference_maps[key]
+
+    def _evict_inference_maps(self, data_hash):
+        # Keep the most recently stored INFERENCE_MAPS_PER_IMAGE entries
+        keys = sorted(self._inference_map_keys(data_hash),
+                      key=lambda key: self.root.inference_maps[key].get("stored", 0))
+        for key in keys[:-INFERENCE_MAPS_PER_IMAGE]:
+            del self.root.inference_maps[key]
+
+    def get_inference_maps(self, name, labels, model_ids):
+        img_model = self.root.images.get(name)
+        if img_model is None:
+            return {}
+        key = (self._content_hash(img_model), tuple(labels), tuple(model_ids))
+        cached = self.root.inference_maps.get(key)
+        if cached is None:
+            return {}
+        return {
+            "maps": read_blob(cached["maps"]),
+            "renders": {k: read_blob(v) for k, v in cached["renders"].items()},
+        }
+
+    def store_inference_maps(self, name, labels, model_ids, map_cache):
+        if name in self.root.images and "maps" in map_cache:
+            key = (self._content_hash(self.root.images[name]), tuple(labels), tuple(model_ids))
+            if key not in self.root.inference_maps:
+                cached = self._to_blobs(map_cache)
+                cached["stored"] = time.time()
+                self.root.inference_maps[key] = cached
+                self._evict_inference_maps(key[0])
+                self._commit("store_inference_maps")
 
     def update_image_tile_data(self, name, tile_data):
         if name in self.root.images:
             img_model = self.root.images[name]
+            tile_data = dict(tile_data)
+            self._store_maps(img_model, tile_data)
             img_model.tile_data = tile_data
             img_model._p_changed = True
-            transaction.commit()
+            self._commit("update_image_tile_data")
+
+    def get_batch_progress(self, run_id):
+        done = self.root.batch_runs.get(run_id)
+        return dict(done.items()) if done is not None else {}
+
+    def mark_batch_done(self, run_id, name):
+        if name in self.root.images:
+            if run_id not in self.root.batch_runs:
+                self.root.batch_runs[run_id] = OOBTree()
+            self.root.batch_runs[run_id][name] = self._content_hash(self.root.images[name])
+            self._commit("mark_batch_done")
 
     def add_label(self, name, walkable, slope_tolerance):
         if name in self.root.labels:
             return False
         self.root.labels[name] = LabelConfig(name, walkable, slope_tolerance)
-        transaction.commit()
+        self._invalidate_text_features(name)
+        self._commit("add_label")
+        self.labels_version += 1
         return True
 
     def update_label(self, name, walkable, slope_tolerance):
@@ -92,20 +302,47 @@ class Database:
             label = self.root.labels[name]
             label.walkable = walkable
             label.slope_tolerance = slope_tolerance
-            transaction.commit()
+            self._commit("update_label")
+            self.labels_version += 1
             return True
         return False
 
     def delete_label(self, name):
         if name in self.root.labels:
             del self.root.labels[name]
-            transaction.commit()
+            self._invalidate_text_features(name)
+            self._commit("delete_label")
+            self.labels_version += 1
             return True
         return False
 
     def get_all_labels(self):
         return list(self.root.labels.values())
 
+    def _invalidate_text_features(self, name):
+        for features in self.root.text_features.values():
+            if name in features:
+                del features[name]
+
+    def get_text_feature_cache(self, model_id, prompt_template):
+        features = self.root.text_features.get((model_id, prompt_template))
+        return dict(features.items()) if features is not None else {}
+
+    def store_text_features(self, model_id, prompt_template, text_cache):
+        key = (model_id, prompt_template)
+        features = self.root.text_features.get(key, {})
+
+        # Skip labels deleted while the analysis was running
+        new_features = {name: feature for name, feature in text_cache.items()
+                        if name in self.root.labels and name not in features}
+        if not new_features:
+            return
+
+        if key not in self.root.text_features:
+            self.root.text_features[key] = OOBTree()
+        self.root.text_features[key].update(new_features)
+        self._commit("store_text_features")
+
     def close(self):
         self.connection.close()
         self.db.close()
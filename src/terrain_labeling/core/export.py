@@ -0,0 +1,21 @@
+from core.models import get_tile_grid
+
+def build_tile_export(tile_data, all_labels):
+    # The JSON document written by "Download JSON" and the batch exporter
+    label_configs = [{"name": l.name, "walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels]
+
+    grid = get_tile_grid(tile_data)
+    raw_tiles = grid.to_dicts() if grid else []
+    clean_tiles = []
+    for t in raw_tiles:
+        clean_tiles.append({
+            "grid_pos": t.get("grid_pos"),
+            "composition": t.get("composition"),
+            "slope_val": t.get("slope_val")
+        })
+
+    return {
+        "config": tile_data.get('config', ""),
+        "labels": label_configs,
+        "tiles": clean_tiles
+    }
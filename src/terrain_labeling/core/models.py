@@ -1,15 +1,125 @@
 import persistent
+import numpy as np
+from ZODB.blob import Blob
+
+
+def read_blob(blob):
+    with blob.open("r") as f:
+        return f.read()
+
 
 class ImageModel(persistent.Persistent):
     def __init__(self, name, data):
         self.name = name
-        self.data = data
+        # Image bytes and generated maps live in blobs so loading or
+        # committing the record never touches the payloads.
+        self.blob = Blob(data)
+        self.maps = {}
+        self.thumbnails = {}
         self.relevant_labels = []
         self.analysis_config = {}
         self.tile_data = {}
+        self.data_hash = None
+        self.image_features = {}
+
+    @property
+    def data(self):
+        blob = getattr(self, 'blob', None)
+        if blob is None:
+            # Records written before blobs kept the bytes inline
+            return self.__dict__.get('data')
+        return read_blob(blob)
+
+    def open_data(self):
+        return self.blob.open("r")
 
 class LabelConfig(persistent.Persistent):
     def __init__(self, name, walkable=True, slope_tolerance=0.5):
         self.name = name
         self.walkable = walkable
         self.slope_tolerance = slope_tolerance
+
+BLOCK_REASONS = ("none", "bad_material", "steep_slope", "no_data")
+
+class TileGrid:
+    # Struct-of-arrays tile data indexed by [row, col]. Composition is stored
+    # as per-mille + 1 for labels present in a tile and 0 for absent ones, so
+    # a label that rounds to 0.0% still shows up in the tile's composition.
+    def __init__(self, labels, composition, slope, dominant, walkable, block_reason, tile_size):
+        self.labels = list(labels)                   # label index table
+        self.composition = composition               # (rows, cols, n_labels) uint16
+        self.slope = slope                           # (rows, cols) float32
+        self.dominant = dominant                     # (rows, cols) int16, -1 for none
+        self.walkable = walkable                     # (rows, cols) bool
+        self.block_reason = block_reason             # (rows, cols) uint8, see BLOCK_REASONS
+        self.tile_size = tuple(tile_size)            # (tile_w, tile_h) in pixels
+
+    @property
+    def shape(self):
+        return self.slope.shape
+
+    def __len__(self):
+        return self.slope.size
+
+    def tile_composition(self, col, row):
+        return {self.labels[i]: (int(v) - 1) / 1000
+                for i, v in enumerate(self.composition[row, col]) if v}
+
+    def tile(self, col, row):
+        # One tile in the dict format produced before TileGrid existed
+        tile_w, tile_h = self.tile_size
+        dominant = int(self.dominant[row, col])
+        return {
+            "id": f"tile_{col}_{row}",
+            "grid_pos": [col, row],
+            "world_pos": [col * tile_w, row * tile_h],
+            "composition": self.tile_composition(col, row),
+            "slope_val": round(float(self.slope[row, col]), 3),
+            "walkable": bool(self.walkable[row, col]),
+            "block_reason": BLOCK_REASONS[self.block_reason[row, col]],
+            "dominant": self.labels[dominant] if dominant >= 0 else "none",
+        }
+
+    def to_dicts(self):
+        rows, cols = self.shape
+        return [self.tile(col, row) for row in range(rows) for col in range(cols)]
+
+    @classmethod
+    def from_dicts(cls, tiles):
+        # Converts the legacy list-of-dicts tile data
+        cols = max(t['grid_pos'][0] for t in tiles) + 1
+        rows = max(t['grid_pos'][1] for t in tiles) + 1
+        labels = list(dict.fromkeys(label for t in tiles for label in t['composition']))
+        index = {label: i for i, label in enumerate(labels)}
+
+        composition = np.zeros((rows, cols, len(labels)), dtype=np.uint16)
+        slope = np.zeros((rows, cols), dtype=np.float32)
+        dominant = np.full((rows, cols), -1, dtype=np.int16)
+        walkable = np.zeros((rows, cols), dtype=bool)
+        block_reason = np.full((rows, cols), BLOCK_REASONS.index("no_data"), dtype=np.uint8)
+
+        tile_w = tile_h = 0
+        for t in tiles:
+            col, row = t['grid_pos']
+            for label, percent in t['composition'].items():
+                composition[row, col, index[label]] = round(percent * 1000) + 1
+            slope[row, col] = t['slope_val']
+            dominant[row, col] = index.get(t['dominant'], -1)
+            walkable[row, col] = t['walkable']
+            block_reason[row, col] = BLOCK_REASONS.index(t['block_reason'])
+            if col:
+                tile_w = t['world_pos'][0] // col
+            if row:
+                tile_h = t['world_pos'][1] // row
+
+        return cls(labels, composition, slope, dominant, walkable, block_reason, (tile_w, tile_h))
+
+
+def get_tile_grid(tile_data):
+    if not tile_data:
+        return None
+    if 'grid' in tile_data:
+        return tile_data['grid']
+    if tile_data.get('data'):
+        return TileGrid.from_dicts(tile_data['data'])
+    return None
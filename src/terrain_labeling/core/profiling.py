@@ -0,0 +1,113 @@
+import collections
+import json
+import os
+import threading
+import time
+
+# Named timing spans kept in a fixed-size ring buffer:
+#
+#     with span("tiles.depth"):
+#         ...
+#
+# Disabled (TERRAIN_TRACE=0) a span is one attribute check and a shared no-op
+# context manager, so instrumentation can stay in place in production.
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        thread = threading.current_thread()
+        self.tracer.events.append((self.name, self.start, end - self.start, thread.ident, thread.name, self.args))
+        return False
+
+
+class Tracer:
+    def __init__(self, capacity=4096, enabled=True):
+        self.enabled = enabled
+        # (name, start_ns, duration_ns, thread id, thread name, args); deque
+        # appends are atomic, so worker threads record without a lock
+        self.events = collections.deque(maxlen=capacity)
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args or None)
+
+    def clear(self):
+        self.events.clear()
+
+    def set_capacity(self, capacity):
+        # None keeps every event, e.g. for a whole batch run
+        self.events = collections.deque(self.events, maxlen=capacity)
+
+    def stats(self):
+        # name -> count / total / mean / max / last duration in ms, over the buffer
+        stats = {}
+        for name, _, duration, _, _, _ in list(self.events):
+            ms = duration / 1e6
+            entry = stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry["last_ms"] = ms
+        for entry in stats.values():
+            entry["mean_ms"] = entry["total_ms"] / entry["count"]
+        return stats
+
+    def to_json(self):
+        return {
+            "events": [
+                {"name": name, "start_ns": start, "duration_ms": duration / 1e6, "thread": thread_name, "args": args or {}}
+                for name, start, duration, _, thread_name, args in list(self.events)
+            ],
+            "stats": self.stats(),
+        }
+
+    def to_chrome_trace(self):
+        # Trace Event Format, loadable in chrome://tracing or Perfetto
+        pid = os.getpid()
+        events = list(self.events)
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                        for tid, thread_name in {e[3]: e[4] for e in events}.items()]
+        for name, start, duration, tid, _, args in events:
+            trace_events.append({
+                "name": name, "cat": name.split(".")[0], "ph": "X",
+                "ts": start / 1000, "dur": duration / 1000,
+                "pid": pid, "tid": tid, "args": args or {},
+            })
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+tracer = Tracer(enabled=os.environ.get("TERRAIN_TRACE", "1") != "0")
+
+def span(name, **args):
+    return tracer.span(name, **args)
@@ -1,10 +1,9 @@
-import sys
-import core.database
-sys.modules['db'] = core.database
+import time
+start_time = time.perf_counter()
 
 from ui.main_window import MainWindow
 
 if __name__ == "__main__":
-    app = MainWindow()
+    app = MainWindow(start_time)
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
     app.mainloop()
@@ -0,0 +1,156 @@
+import os
+import time
+
+import numpy as np
+
+from core.profiling import span
+
+# How LabelSelector and TileGenerator run their models on the CPU:
+#
+#   fp32  stock PyTorch (the reference)
+#   int8  PyTorch with dynamically quantized int8 Linear layers (torchao)
+#
+# Outputs differ slightly between backends, so anything cached from them is
+# keyed by backend as well as model. compare() and `python -m ml.backends`
+# measure speed and agreement with fp32 on sample maps.
+
+BACKENDS = ("fp32", "int8")
+
+def default_backend():
+    return os.environ.get("TERRAIN_BACKEND", "fp32")
+
+def check_backend(backend):
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return backend
+
+def quantize(model):
+    # Weights of every Linear layer become int8; activations are quantized
+    # on the fly per batch, so no calibration data is needed
+    from torchao.quantization import quantize_, Int8DynamicActivationInt8WeightConfig
+
+    with span("backend.quantize"):
+        quantize_(model, Int8DynamicActivationInt8WeightConfig())
+    return model
+
+def prepare(model, backend):
+    if backend == "int8":
+        return quantize(model)
+    return model
+
+
+def _label_agreement(labels, reference):
+    # Jaccard overlap of the selected label names
+    names = {l["name"] for l in labels}
+    reference = {l["name"] for l in reference}
+    if not names and not reference:
+        return 1.0
+    return len(names & reference) / len(names | reference)
+
+def compare(images, labels, label_configs, backends=BACKENDS, make_models=None, prompt="a top-down rpg map texture of {}",
+            top_k=5, threshold=0.2, rows=20, cols=20):
+    # Runs every sample image through each backend and measures it against
+    # fp32 (always run first, as the reference). make_models(backend) returns
+    # a (LabelSelector, TileGenerator) pair. Per backend returns load time,
+    # mean analyze/generate seconds per image and mean agreement with fp32 of
+    # the chosen labels, per-pixel materials and per-tile walkability.
+    if make_models is None:
+        from ml.label_selector import LabelSelector
+        from ml.tile_generator import TileGenerator
+        make_models = lambda backend: (LabelSelector(backend), TileGenerator(backend=backend))
+
+    backends = ["fp32"] + [b for b in backends if b != "fp32"]
+    reference = []
+    results = []
+    for backend in backends:
+        selector, generator = make_models(backend)
+        start = time.perf_counter()
+        selector._load_model()
+        generator._load_models()
+        load_time = time.perf_counter() - start
+
+        # Untimed first pass: encodes the label prompts and warms up the runtime
+        text_cache = {}
+        selector.analyze(images[0], labels, prompt, top_k, threshold, text_cache=text_cache)
+        generator.generate(images[0], labels, rows, cols, label_configs)
+
+        outputs = []
+        analyze_time = generate_time = 0.0
+        for image in images:
+            start = time.perf_counter()
+            selected = selector.analyze(image, labels, prompt, top_k, threshold, text_cache=text_cache)
+            analyze_time += time.perf_counter() - start
+
+            # Maps are always generated for the full label list, so the tile
+            # comparison does not depend on the label selection
+            map_cache = {}
+            start = time.perf_counter()
+            tile_data = generator.generate(image, labels, rows, cols, label_configs, map_cache=map_cache)
+            generate_time += time.perf_counter() - start
+            if tile_data is None:
+                raise RuntimeError(f"Tile generation failed with the {backend} backend")
+            mat_map, _ = generator._unpack_maps(map_cache["maps"])
+            outputs.append((selected, mat_map, tile_data["grid"].walkable))
+
+        if backend == "fp32":
+            reference = outputs
+        results.append({
+            "backend": backend,
+            "load_s": load_time,
+            "analyze_s": analyze_time / len(images),
+            "generate_s": generate_time / len(images),
+            "label_agreement": float(np.mean([_label_agreement(out[0], ref[0]) for out, ref in zip(outputs, reference)])),
+            "material_agreement": float(np.mean([(out[1] == ref[1]).mean() for out, ref in zip(outputs, reference)])),
+            "walkable_agreement": float(np.mean([(out[2] == ref[2]).mean() for out, ref in zip(outputs, reference)])),
+        })
+    return results
+
+def recommend(results, min_agreement):
+    # Fastest backend whose label, material and walkability agreement with
+    # fp32 are all at least min_agreement (fp32 itself always qualifies)
+    eligible = [r for r in results
+                if min(r["label_agreement"], r["material_agreement"], r["walkable_agreement"]) >= min_agreement]
+    return min(eligible, key=lambda r: r["analyze_s"] + r["generate_s"])["backend"]
+
+def main(argv=None):
+    import argparse
+    from core.database import Database
+    from ml.image_io import DecodedImage
+
+    parser = argparse.ArgumentParser(description="Compare inference backends with fp32 on sample maps.")
+    parser.add_argument("--input", required=True, help="Directory of sample map images")
+    parser.add_argument("--db", help="Database whose labels are used (default: mydata.fs next to main.py)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="Lowest acceptable agreement with fp32 (0-1) when picking a backend")
+    parser.add_argument("--limit", type=int, default=10, help="Use at most this many sample images")
+    args = parser.parse_args(argv)
+
+    extensions = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+    paths = sorted(os.path.join(args.input, f) for f in os.listdir(args.input) if f.lower().endswith(extensions))
+    images = [DecodedImage(path) for path in paths[:args.limit]]
+    if not images:
+        parser.error(f"No images in {args.input}")
+
+    db = Database(args.db)
+    try:
+        all_labels = db.get_all_labels()
+    finally:
+        db.close()
+    labels = [l.name for l in all_labels]
+    label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
+
+    results = compare(images, labels, label_configs, args.backends)
+
+    print(f"\n{len(images)} sample maps, {len(labels)} labels")
+    print(f"{'Backend':<8}{'Load s':>8}{'Analyze s':>11}{'Generate s':>12}{'Labels':>9}{'Materials':>11}{'Walkable':>10}")
+    for r in results:
+        print(f"{r['backend']:<8}{r['load_s']:>8.1f}{r['analyze_s']:>11.3f}{r['generate_s']:>12.3f}"
+              f"{r['label_agreement']:>9.1%}{r['material_agreement']:>11.1%}{r['walkable_agreement']:>10.1%}")
+    backend = recommend(results, args.min_agreement)
+    print(f"\nFastest backend with at least {args.min_agreement:.0%} agreement: {backend} "
+          f"(run with TERRAIN_BACKEND={backend})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import io
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from core.profiling import span
+
+# Reduced decodes are kept at a short side of at least this many pixels, the
+# largest model input (Depth Anything, 518px), so one decode serves them all
+REDUCED_MIN_SIDE = 518
+
+class DecodedImage:
+    # An input image decoded at most once and shared by every stage that needs
+    # it (label analysis, tile generation). The source can be a file path,
+    # bytes / bytearray / memoryview, a binary file object, a PIL image, a
+    # numpy array (H x W or H x W x 3/4, uint8) or another DecodedImage.
+    #
+    # Models only see a few hundred pixels, so they ask for rgb(min_side=...):
+    # JPEGs are then decoded at 1/2-1/8 scale (draft mode) and other formats
+    # are reduced right after decoding, and the full-size pixels are only
+    # kept when someone asks for rgb() itself.
+    def __init__(self, source, name=None):
+        self.source = source
+        self.name = name or (os.fspath(source) if isinstance(source, (str, os.PathLike)) else None)
+        self._rgb = None
+        self._reduced = None
+        self._size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def of(cls, source):
+        return source if isinstance(source, cls) else cls(source)
+
+    def __repr__(self):
+        return f"<DecodedImage {self.name or type(self.source).__name__}>"
+
+    @property
+    def size(self):
+        # Full-resolution (width, height), read from the header when not decoded
+        with self._lock:
+            if self._size is None:
+                source = self.source
+                if self._rgb is not None:
+                    self._size = self._rgb.size
+                elif isinstance(source, Image.Image):
+                    self._size = source.size
+                elif isinstance(source, np.ndarray):
+                    self._size = (source.shape[1], source.shape[0])
+                else:
+                    with Image.open(self._open()) as image:
+                        self._size = image.size
+            return self._size
+
+    def rgb(self, min_side=None):
+        # Full resolution, or with min_side the smallest cached or cheaply
+        # decodable version whose shorter side is still at least min_side
+        with self._lock:
+            if min_side is None or self._rgb is not None:
+                if self._rgb is None:
+                    with span("image.decode"):
+                        self._rgb = self._decode()
+                    self._reduced = None
+                image = self._rgb
+            else:
+                # Small images cannot do better than their own size
+                if self._reduced is None or min(self._reduced.size) < min(min_side, *self._size):
+                    with span("image.decode", min_side=min_side):
+                        self._reduced = self._decode(max(min_side, REDUCED_MIN_SIDE))
+                    if self._reduced.size == self._size:
+                        self._rgb = self._reduced
+                image = self._reduced
+        return image if min_side is None else self._reduce(image, min_side)
+
+    @staticmethod
+    def _reduce(image, min_side):
+        factor = min(image.size) // min_side
+        return image.reduce(factor) if factor >= 2 else image
+
+    def _decode(self, min_side=None):
+        source = self.source
+        if isinstance(source, Image.Image):
+            image = source if source.mode == "RGB" else source.convert("RGB")
+        elif isinstance(source, np.ndarray):
+            image = Image.fromarray(source).convert("RGB")
+        else:
+            image = Image.open(self._open())
+            self._size = image.size   # before draft() shrinks it
+            if min_side and image.format == "JPEG":
+                # Let the JPEG decoder skip the detail: draft picks the
+                # coarsest DCT scale that stays at or above the requested size
+                scale = min_side / min(image.size)
+                image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+        self._size = image.size if self._size is None else self._size
+        if min_side:
+            image = self._reduce(image, min_side)
+        # Loaded up front so threads sharing the handle only ever read it
+        image.load()
+        return image
+
+    def _open(self):
+        source = self.source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return io.BytesIO(source)
+        if hasattr(source, "seek"):
+            source.seek(0)   # file objects are read more than once
+        return source   # path or file object, opened by PIL
+
+    def encoded(self):
+        # The original encoded bytes when there are any, PNG otherwise
+        source = self.source
+        if isinstance(source, bytes):
+            return source
+        if isinstance(source, (bytearray, memoryview)):
+            return bytes(source)
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return f.read()
+        if hasattr(source, "read"):
+            return self._open().read()
+        with io.BytesIO() as bio:
+            self.rgb().save(bio, format="PNG")
+            return bio.getvalue()
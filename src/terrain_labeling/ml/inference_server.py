@@ -0,0 +1,360 @@
+import argparse
+import base64
+import io
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from core.models import TileGrid
+from ml import tile_logic
+from ml.image_io import DecodedImage
+
+DEFAULT_PORT = 8765
+
+# Wire format: JSON bodies, bytes as base64 and numpy arrays as base64 .npy
+def _encode_bytes(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _decode_bytes(text):
+    return base64.b64decode(text)
+
+def _encode_array(array):
+    with io.BytesIO() as bio:
+        np.save(bio, array, allow_pickle=False)
+        return _encode_bytes(bio.getvalue())
+
+def _decode_array(text):
+    return np.load(io.BytesIO(_decode_bytes(text)), allow_pickle=False)
+
+def _encode_grid(grid):
+    return {
+        "labels": grid.labels,
+        "tile_size": list(grid.tile_size),
+        "arrays": {name: _encode_array(getattr(grid, name))
+                   for name in ("composition", "slope", "dominant", "walkable", "block_reason")},
+    }
+
+def _decode_grid(payload):
+    arrays = {name: _decode_array(value) for name, value in payload["arrays"].items()}
+    return TileGrid(payload["labels"], tile_size=payload["tile_size"], **arrays)
+
+def _encode_map_cache(map_cache):
+    if not map_cache or "maps" not in map_cache:
+        return None
+    return {
+        "maps": _encode_bytes(map_cache["maps"]),
+        "renders": {k: _encode_bytes(v) for k, v in map_cache.get("renders", {}).items()},
+    }
+
+def _decode_map_cache(payload):
+    if not payload:
+        return {}
+    return {
+        "maps": _decode_bytes(payload["maps"]),
+        "renders": {k: _decode_bytes(v) for k, v in payload["renders"].items()},
+    }
+
+
+class MicroBatcher:
+    # Collects submitted items into batches of at most max_batch_size, waiting
+    # no longer than max_latency seconds after the first item of a batch, and
+    # runs handler(items) -> results on a single worker thread.
+    def __init__(self, handler, max_batch_size=8, max_latency=0.02, name="batcher"):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.items = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.items.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self.items.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.items.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class InferenceServer:
+    # Keeps one LabelSelector and one TileGenerator resident for every client.
+    # Label requests arriving together share CLIP vision forward passes. Tile
+    # requests are not batched: their CLIPSeg and depth inputs differ in labels
+    # and image size, so they are queued and run one at a time.
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, max_batch_size=8, max_latency_ms=20,
+                 tile_options=None, backend=None):
+        from ml.label_selector import LabelSelector
+        from ml.tile_generator import TileGenerator
+
+        self.label_selector = LabelSelector(backend)
+        self.tile_generator = TileGenerator(**(tile_options or {}), backend=backend)
+        self.text_caches = {}   # prompt template -> label name -> text feature
+
+        max_latency = max_latency_ms / 1000
+        self.analyze_batcher = MicroBatcher(self._analyze_batch, max_batch_size, max_latency, name="analyze")
+        self.generate_batcher = MicroBatcher(self._generate_batch, 1, 0, name="generate")
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/info":
+                    self.send_error(404)
+                    return
+                server._handle(self, server._info)
+
+            def do_POST(self):
+                routes = {"/analyze": server.analyze_batcher.submit, "/generate": server.generate_batcher.submit}
+                route = routes.get(self.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                server._handle(self, lambda: route(request).result())
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+
+    def _handle(self, handler, fn):
+        try:
+            body, status = json.dumps(fn()).encode(), 200
+        except Exception as e:
+            body, status = json.dumps({"error": str(e)}).encode(), 500
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _info(self):
+        return {
+            "label_feature_id": self.label_selector.feature_id,
+            "inference_id": list(self.tile_generator.inference_id()),
+        }
+
+    def _analyze_batch(self, requests):
+        import torch
+        selector = self.label_selector
+        results = [None] * len(requests)
+        image_features = [None] * len(requests)
+
+        # Crops of every request that has no cached features go through one vision pass
+        crops, owners = [], []
+        for i, request in enumerate(requests):
+            if request.get("image_features"):
+                image_features[i] = _decode_array(request["image_features"])
+                continue
+            try:
+                image = DecodedImage(_decode_bytes(request["image"])).rgb(selector.DECODE_MIN_SIDE)
+            except Exception as e:
+                results[i] = e
+                continue
+            for crop in selector._get_crops(image):
+                crops.append(crop)
+                owners.append(i)
+
+        if crops:
+            encoded = selector._encode_crops(crops).numpy()
+            for i in set(owners):
+                image_features[i] = encoded[[j for j, owner in enumerate(owners) if owner == i]]
+
+        for i, request in enumerate(requests):
+            if results[i] is not None:
+                continue
+            labels = request["labels"]
+            if not labels:
+                results[i] = {"results": [], "image_features": _encode_array(image_features[i])}
+                continue
+            text_cache = self.text_caches.setdefault(request["prompt"], {})
+            text_features = selector._encode_text(labels, request["prompt"], text_cache)
+            scored = selector._score(
+                torch.from_numpy(image_features[i]), text_features, labels, request["top_k"], request["threshold"]
+            )
+            results[i] = {"results": scored, "image_features": _encode_array(image_features[i])}
+
+        return results
+
+    def _generate_batch(self, requests):
+        # Always a single request (the generate queue's batch size is 1)
+        results = []
+        for request in requests:
+            map_cache = _decode_map_cache(request.get("map_cache"))
+            # Clients with cached maps send those instead of the image
+            cached = bool(map_cache)
+            image = _decode_bytes(request["image"]) if "image" in request else None
+            if image is None and not cached:
+                results.append(ValueError("generate needs an image or cached maps"))
+                continue
+            result = self.tile_generator.generate(
+                image, request["labels"], request["rows"], request["cols"],
+                label_configs=request["label_configs"], walkability_threshold=request["walkability_threshold"],
+                map_cache=map_cache,
+            )
+            if result is None:
+                results.append(RuntimeError("tile generation failed"))
+                continue
+            results.append({
+                "config": result["config"],
+                "grid": _encode_grid(result["grid"]),
+                "maps": {k: _encode_bytes(v) for k, v in result["maps"].items()},
+                # The client already has the maps it sent
+                "map_cache": None if cached else _encode_map_cache(map_cache),
+            })
+        return results
+
+    def serve_forever(self):
+        print(f"Inference server listening on http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}")
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _Client:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self._info = None
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            raise RuntimeError(message) from None
+        except OSError as e:
+            # Refused, unreachable or timed out: the same RuntimeError as a
+            # server-side failure, so callers have one error to report
+            raise RuntimeError(f"Inference server {self.url} unavailable: {getattr(e, 'reason', e)}") from None
+
+    def info(self):
+        if self._info is None:
+            self._info = self._request("/info")
+        return self._info
+
+
+class RemoteLabelSelector(_Client):
+    # LabelSelector API backed by an InferenceServer
+    @property
+    def feature_id(self):
+        return self.info()["label_feature_id"]
+
+    def analyze(self, image, labels, prompt_template, top_k=5, threshold=0.2, text_cache=None, image_cache=None,
+                progress=None):
+        if not labels:
+            return []
+        if progress: progress("Waiting for inference server", 0.0)
+        request = {"labels": list(labels), "prompt": prompt_template, "top_k": top_k, "threshold": threshold}
+        if image_cache is not None and "features" in image_cache:
+            request["image_features"] = _encode_array(image_cache["features"])
+        else:
+            request["image"] = _encode_bytes(DecodedImage.of(image).encoded())
+
+        response = self._request("/analyze", request)
+        if image_cache is not None:
+            image_cache["features"] = _decode_array(response["image_features"])
+        return response["results"]
+
+
+class RemoteTileGenerator(_Client):
+    # TileGenerator API backed by an InferenceServer
+    def __init__(self, url):
+        super().__init__(url)
+        self.analyze_tile_logic = tile_logic.analyze_tile_logic
+        self.evaluate_grid = tile_logic.evaluate_grid
+
+    def inference_id(self):
+        return tuple(self.info()["inference_id"])
+
+    def generate(self, image, labels, rows, cols, label_configs=None, walkability_threshold=0.4, map_cache=None,
+                 progress=None):
+        if progress: progress("Waiting for inference server", 0.0)
+        request = {
+            "labels": list(labels), "rows": rows, "cols": cols,
+            "label_configs": label_configs or {}, "walkability_threshold": walkability_threshold,
+            "map_cache": _encode_map_cache(map_cache),
+        }
+        # With cached maps the server only re-tiles, so the image is not uploaded
+        if request["map_cache"] is None:
+            request["image"] = _encode_bytes(DecodedImage.of(image).encoded())
+        try:
+            response = self._request("/generate", request)
+        except Exception as e:
+            print(f"Error in generate: {e}")
+            return None
+
+        if map_cache is not None and response["map_cache"]:
+            map_cache.update(_decode_map_cache(response["map_cache"]))
+        return {
+            "config": response["config"],
+            "grid": _decode_grid(response["grid"]),
+            "maps": {k: _decode_bytes(v) for k, v in response["maps"].items()},
+        }
+
+
+def main(argv=None):
+    from ml.backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="Serve LabelSelector and TileGenerator to local clients.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Label requests merged into one batch")
+    parser.add_argument("--max-latency-ms", type=float, default=20, help="Longest wait for a label batch to fill")
+    parser.add_argument("--window-size", type=int, default=None)
+    parser.add_argument("--preload", action="store_true", help="Load the models before accepting requests")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="Inference backend (default: $TERRAIN_BACKEND or fp32)")
+    args = parser.parse_args(argv)
+
+    server = InferenceServer(args.host, args.port, args.max_batch_size, args.max_latency_ms,
+                             tile_options={"window_size": args.window_size}, backend=args.backend)
+    if args.preload:
+        server.label_selector._load_model()
+        server.tile_generator._load_models()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
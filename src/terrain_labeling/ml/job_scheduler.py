@@ -0,0 +1,129 @@
+import itertools
+import queue
+import threading
+
+# Job priorities: lower runs first
+INTERACTIVE = 0
+BATCH = 10
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, image_id, kind, fn, priority, on_progress, on_done):
+        self.image_id = image_id
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.state = "queued"   # queued -> running -> done / failed / cancelled
+        self._cancel = threading.Event()
+
+    def __repr__(self):
+        return f"<Job {self.kind} {self.image_id} {self.state}>"
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, stage, fraction=None):
+        # Handed to analyze()/generate() as their progress callback. Stage
+        # boundaries double as cancellation points for a running job.
+        if self.cancelled:
+            raise JobCancelled()
+        if self.on_progress:
+            self.on_progress(self, stage, fraction)
+
+
+class JobScheduler:
+    # Runs inference jobs on a fixed number of worker threads from a bounded
+    # priority queue, so only `workers` jobs use the models at any time.
+    # fn(job) does the work; on_progress(job, stage, fraction) and
+    # on_done(job, result, error) are called from the worker thread.
+    def __init__(self, workers=1, max_queued=16, threads_per_worker=None):
+        self.threads_per_worker = threads_per_worker
+        self.queue = queue.PriorityQueue(maxsize=max_queued)
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._active = []
+        self._stopped = threading.Event()
+        self._workers = [threading.Thread(target=self._run, name=f"inference-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image_id, kind, fn, priority=INTERACTIVE, on_progress=None, on_done=None):
+        # Raises queue.Full when max_queued jobs are already waiting
+        job = Job(image_id, kind, fn, priority, on_progress, on_done)
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError("Job scheduler has been shut down")
+            self.queue.put_nowait((priority, next(self._order), job))
+            self._active.append(job)
+        return job
+
+    def find(self, image_id, kind=None):
+        # Queued or running jobs for an image that have not been cancelled
+        with self._lock:
+            return [job for job in self._active
+                    if job.image_id == image_id and kind in (None, job.kind) and not job.cancelled]
+
+    def cancel(self, image_id, kind=None):
+        for job in self.find(image_id, kind):
+            job.cancel()
+
+    def shutdown(self):
+        # Never blocks: it runs on the Tk thread, which a worker's on_done may
+        # be waiting on. Queued jobs are dropped without callbacks; workers
+        # exit after their current job.
+        self._stopped.set()
+        with self._lock:
+            for job in self._active:
+                job.cancel()
+            while True:
+                try:
+                    _, _, job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    self._active.remove(job)
+            # Wakes workers idling in get() (daemon threads, so any left
+            # waiting when there are more workers than slots die with the app)
+            for _ in self._workers:
+                try:
+                    self.queue.put_nowait((float("inf"), next(self._order), None))
+                except queue.Full:
+                    break
+
+    def _run(self):
+        if self.threads_per_worker:
+            import torch
+            torch.set_num_threads(self.threads_per_worker)
+
+        while True:
+            _, _, job = self.queue.get()
+            if job is None or self._stopped.is_set():
+                return
+
+            result, error = None, None
+            if job.cancelled:
+                error = JobCancelled()
+            else:
+                job.state = "running"
+                try:
+                    result = job.fn(job)
+                except Exception as e:
+                    error = e
+
+            job.state = "done" if error is None else "cancelled" if isinstance(error, JobCancelled) else "failed"
+            with self._lock:
+                self._active.remove(job)
+            if job.on_done:
+                try:
+                    job.on_done(job, result, error)
+                except Exception as e:
+                    print(f"Job callback error: {e}")
@@ -1,44 +1,65 @@
+import threading
 import torch
-from PIL import Image
+import numpy as np
+from ml.image_io import DecodedImage
+from ml import backends
+from core.profiling import span
 from transformers import CLIPProcessor, CLIPModel
 
 
 class LabelSelector:
-    def __init__(self):
+    MODEL_ID = "openai/clip-vit-base-patch32"
+    # CLIP sees 224px; the quadrant crops are half the image, so decoding
+    # beyond twice that only costs time
+    DECODE_MIN_SIDE = 448
+
+    def __init__(self, backend=None):
         print("Initializing LabelSelector (Lazy Loading)...")
+        self.backend = backends.check_backend(backend)
+        # Cached text/image features are only valid for the model and backend that made them
+        self.feature_id = self.MODEL_ID if self.backend == "fp32" else f"{self.MODEL_ID}#{self.backend}"
         self.model = None
         self.processor = None
+        # Background warm-up and a first request may race to load the model
+        self._load_lock = threading.Lock()
         self._initialized = True
 
     def _load_model(self):
-        if self.model is None:
-            print("Loading CLIP Model...")
-            self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            print("CLIP Model Loaded.")
+        with self._load_lock:
+            if self.model is None:
+                print("Loading CLIP Model...")
+                with span("clip.load_model", backend=self.backend):
+                    processor = CLIPProcessor.from_pretrained(self.MODEL_ID)
+                    model = CLIPModel.from_pretrained(self.MODEL_ID)
+                    self.processor = processor
+                    self.model = backends.prepare(model, self.backend)
+                print(f"CLIP Model Loaded ({self.backend}).")
 
-    def analyze(self, image_path, labels, prompt_template, top_k=5, threshold=0.2):
-        self._load_model()
-        
-        if not labels:
-            return []
+    def _encode_text(self, labels, prompt_template, text_cache=None):
+        # text_cache maps label name -> normalized feature vector for this
+        # (model, prompt template); missing entries are encoded and filled in.
+        if text_cache is None:
+            text_cache = {}
 
-        # Prepare Text Features
-        text_inputs = [prompt_template.format(l) for l in labels]
-        inputs = self.processor(text=text_inputs, return_tensors="pt", padding=True)
-        
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-
-        try:
-            image = Image.open(image_path).convert("RGB")
-        except Exception as e:
-            print(f"Error opening image {image_path}: {e}")
-            return []
+        missing = [l for l in labels if l not in text_cache]
+        if missing:
+            self._load_model()
+            text_inputs = [prompt_template.format(l) for l in missing]
+            inputs = self.processor(text=text_inputs, return_tensors="pt", padding=True)
+
+            with torch.no_grad(), span("clip.encode_text", labels=len(missing)):
+                features = self.model.get_text_features(**inputs)
+                features /= features.norm(dim=-1, keepdim=True)
 
+            for label, feature in zip(missing, features.numpy()):
+                text_cache[label] = feature
+
+        return torch.from_numpy(np.stack([text_cache[l] for l in labels]))
+
+    @staticmethod
+    def _get_crops(image):
         w, h = image.size
-        crops = [
+        return [
             image,                            # Global
             image.crop((0, 0, w//2, h//2)),   # Top-Left
             image.crop((w//2, 0, w, h//2)),   # Top-Right
@@ -46,16 +67,37 @@ class LabelSelector:
             image.crop((w//2, h//2, w, h))    # Bottom-Right
         ]
 
-        inputs = self.processor(images=crops, return_tensors="pt", padding=True)
+    def _encode_crops(self, crops):
+        self._load_model()
+        with span("clip.preprocess"):
+            inputs = self.processor(images=crops, return_tensors="pt", padding=True)
 
-        with torch.no_grad():
+        with torch.no_grad(), span("clip.encode_image", crops=len(crops)):
             image_features = self.model.get_image_features(**inputs)
             image_features /= image_features.norm(dim=-1, keepdim=True)
 
-            similarity = (image_features @ text_features.T)
-            
-            # Max-Pooling across views
-            max_scores, _ = similarity.max(dim=0) # Shape: (N,)
+        return image_features
+
+    def _encode_image(self, image, image_cache=None):
+        # image_cache holds the normalized per-crop features of one image under
+        # "features"; when present the vision encoder is skipped entirely.
+        if image_cache is not None and "features" in image_cache:
+            return torch.from_numpy(image_cache["features"])
+
+        # Decode errors propagate: an unreadable image has no labels to store
+        rgb = DecodedImage.of(image).rgb(self.DECODE_MIN_SIDE)
+        image_features = self._encode_crops(self._get_crops(rgb))
+
+        if image_cache is not None:
+            image_cache["features"] = image_features.numpy()
+        return image_features
+
+    @staticmethod
+    def _score(image_features, text_features, labels, top_k, threshold):
+        similarity = (image_features @ text_features.T)
+
+        # Max-Pooling across views
+        max_scores, _ = similarity.max(dim=0) # Shape: (N,)
 
         top_indices = max_scores.argsort(descending=True)[:top_k]
         
@@ -66,3 +108,73 @@ class LabelSelector:
                 results.append({'name': labels[idx], 'score': score})
         
         return results
+
+    def analyze(self, image, labels, prompt_template, top_k=5, threshold=0.2, text_cache=None, image_cache=None,
+                progress=None):
+        # image: path, encoded bytes / memoryview, PIL image, numpy array or DecodedImage
+        # progress(stage, fraction) is called as each stage starts. Raises if
+        # the image cannot be decoded.
+        if not labels:
+            return []
+
+        with span("analyze", labels=len(labels)):
+            # Prepare Text Features
+            if progress: progress("Encoding labels", 0.0)
+            text_features = self._encode_text(labels, prompt_template, text_cache)
+
+            if progress: progress("Encoding image", 0.2)
+            image_features = self._encode_image(image, image_cache)
+
+            if progress: progress("Scoring labels", 0.9)
+            return self._score(image_features, text_features, labels, top_k, threshold)
+
+    def analyze_many(self, images, labels, prompt_template, top_k=5, threshold=0.2, batch_size=40, text_cache=None):
+        # Yields (image, results) in input order. Crops from consecutive images
+        # are packed into vision batches of `batch_size`, so memory stays bounded
+        # by one batch no matter how many images are streamed through. Images
+        # that cannot be decoded yield None rather than an empty label list.
+        if not labels:
+            for image in images:
+                yield image, []
+            return
+
+        text_features = self._encode_text(labels, prompt_template, text_cache)
+
+        pending = []        # per-image entries, in input order
+        batch, owners = [], []
+
+        for image in images:
+            entry = {"image": image, "features": [], "crops": 0}
+            pending.append(entry)
+
+            try:
+                rgb = DecodedImage.of(image).rgb(self.DECODE_MIN_SIDE)
+            except Exception as e:
+                print(f"Error opening image {image}: {e}")
+            else:
+                for crop in self._get_crops(rgb):
+                    batch.append(crop)
+                    owners.append(entry)
+                    entry["crops"] += 1
+
+            while len(batch) >= batch_size:
+                self._encode_batch(batch[:batch_size], owners[:batch_size])
+                del batch[:batch_size], owners[:batch_size]
+                yield from self._drain_completed(pending, text_features, labels, top_k, threshold)
+
+        if batch:
+            self._encode_batch(batch, owners)
+        yield from self._drain_completed(pending, text_features, labels, top_k, threshold)
+
+    def _encode_batch(self, crops, owners):
+        for entry, feature in zip(owners, self._encode_crops(crops)):
+            entry["features"].append(feature)
+
+    def _drain_completed(self, pending, text_features, labels, top_k, threshold):
+        while pending and len(pending[0]["features"]) == pending[0]["crops"]:
+            entry = pending.pop(0)
+            if not entry["crops"]:
+                yield entry["image"], None
+                continue
+            image_features = torch.stack(entry["features"])
+            yield entry["image"], self._score(image_features, text_features, labels, top_k, threshold)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+class ModelLoader:
+    # Creates the LabelSelector and TileGenerator on first use, so importing the
+    # UI does not import torch and transformers. warm_up() runs those imports and
+    # loads the weights on a background thread while the window is already up.
+    def __init__(self, inference_url=None):
+        self.inference_url = inference_url
+        self.timings = {}   # cold-start stage -> seconds
+        self._lock = threading.RLock()
+        self._label_selector = None
+        self._tile_generator = None
+
+    @property
+    def label_selector(self):
+        with self._lock:
+            if self._label_selector is None:
+                self._create()
+            return self._label_selector
+
+    @property
+    def tile_generator(self):
+        with self._lock:
+            if self._tile_generator is None:
+                self._create()
+            return self._tile_generator
+
+    def _create(self):
+        start = time.perf_counter()
+        if self.inference_url:
+            from ml.inference_server import RemoteLabelSelector, RemoteTileGenerator
+            self._label_selector = RemoteLabelSelector(self.inference_url)
+            self._tile_generator = RemoteTileGenerator(self.inference_url)
+        else:
+            from ml.label_selector import LabelSelector
+            from ml.tile_generator import TileGenerator
+            self._label_selector = LabelSelector() # Singleton lazy init
+            self._tile_generator = TileGenerator() # Singleton lazy init
+        self.timings["imports"] = time.perf_counter() - start
+
+    def warm_up(self, on_status=None):
+        # on_status(text, state) is called from the warm-up thread, state being
+        # "loading", "ready" or "error"
+        threading.Thread(target=self._warm_up, args=(on_status or (lambda text, state: None),),
+                         name="model-warm-up", daemon=True).start()
+
+    def _warm_up(self, on_status):
+        start = time.perf_counter()
+        try:
+            on_status("Importing ML libraries...", "loading")
+            label_selector, tile_generator = self.label_selector, self.tile_generator
+
+            if self.inference_url:
+                tile_generator.inference_id()
+                on_status(f"Using inference server at {self.inference_url}", "ready")
+                return
+
+            on_status("Loading CLIP...", "loading")
+            stage = time.perf_counter()
+            label_selector._load_model()
+            self.timings["clip"] = time.perf_counter() - stage
+
+            on_status("Loading CLIPSeg and Depth...", "loading")
+            stage = time.perf_counter()
+            tile_generator._load_models()
+            self.timings["clipseg_depth"] = time.perf_counter() - stage
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+            on_status(f"Model warm-up failed: {e}", "error")
+            return
+
+        breakdown = self.describe_timings()
+        print(f"Cold start: {time.perf_counter() - start:.1f}s ({breakdown})")
+        on_status(f"Models ready ({breakdown})", "ready")
+
+    def describe_timings(self):
+        names = {"imports": "imports", "clip": "CLIP", "clipseg_depth": "CLIPSeg/Depth"}
+        return ", ".join(f"{names[k]} {v:.1f}s" for k, v in self.timings.items())
@@ -0,0 +1,31 @@
+import colorsys
+
+import numpy as np
+from PIL import Image
+
+GOLDEN_RATIO_CONJUGATE = 0.6180339887498949
+
+def label_colors(labels):
+    # One colour per label, in label order. Successive hues step by the golden
+    # ratio, which keeps every hue as far as possible from those before it, and
+    # the brightness alternates so labels a few steps apart still differ.
+    colors = []
+    for i in range(len(labels)):
+        hue = (0.05 + i * GOLDEN_RATIO_CONJUGATE) % 1.0
+        value = 0.92 if i % 2 == 0 else 0.68
+        colors.append(tuple(round(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.7, value)))
+    return colors
+
+def label_palette(labels):
+    # (len(labels), 3) uint8 lookup table indexed by label id
+    return np.array(label_colors(labels), dtype=np.uint8).reshape(-1, 3)
+
+def colorize(mat_map, labels):
+    # Label-id map -> PIL image without float intermediates: a "P" image using
+    # the palette directly when ids fit in a byte, an RGB lookup otherwise.
+    palette = label_palette(labels)
+    if len(labels) <= 256:
+        image = Image.fromarray(mat_map.astype(np.uint8, copy=False), mode="P")
+        image.putpalette(palette.tobytes())
+        return image
+    return Image.fromarray(palette[mat_map])
@@ -4,184 +4,474 @@ from PIL import Image
 from transformers import CLIPSegProcessor, CLIPSegForImageSegmentation, pipeline
 
 import io
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.models import TileGrid
+from ml import tile_logic
+from ml.palette import colorize
+from ml.image_io import DecodedImage
+from ml import backends
+from core.profiling import span
 
 class TileGenerator:
-    def __init__(self):
+    SEGMENT_MODEL_ID = "CIDAS/clipseg-rd64-refined"
+    DEPTH_MODEL_ID = "depth-anything/Depth-Anything-V2-Small-hf"
+    MODEL_IDS = (SEGMENT_MODEL_ID, DEPTH_MODEL_ID)
+    # Input resolutions of the models: images are decoded no larger than
+    # needed for them, and only the label and slope maps are full size
+    SEGMENT_MIN_SIDE = 352
+    DEPTH_MIN_SIDE = 518
+    POSTPROCESS_BAND_ROWS = 128
+
+    def __init__(self, prompt_batch_size=8, window_size=None, window_overlap=128, window_batch_size=4,
+                 concurrent=None, segment_threads=None, depth_threads=None, backend=None):
         print("Initializing TileGenerator (Lazy Loading)...")
+        self.backend = backends.check_backend(backend)
+        self.prompt_batch_size = prompt_batch_size
+        # Windowed mode: maps larger than window_size px are segmented and
+        # depth-estimated in overlapping windows instead of as a whole.
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self.window_batch_size = window_batch_size
+        # Concurrent mode: CLIPSeg and depth run side by side, each started with
+        # its own torch intra-op thread budget (default: half the cores each).
+        # Off unless asked for here or with TERRAIN_CONCURRENT=1.
+        if concurrent is None:
+            concurrent = os.environ.get("TERRAIN_CONCURRENT") == "1"
+        self.concurrent = concurrent
+        self.segment_threads = segment_threads
+        self.depth_threads = depth_threads
         self.processor = None
         self.segment_model = None
         self.depth_pipe = None
+        # Background warm-up and a first request may race to load the models
+        self._load_lock = threading.Lock()
         self._initialized = True
 
     def _load_models(self):
-        if self.segment_model is None:
-            print("Loading CLIPSeg and Depth Models...")
-            self.processor = CLIPSegProcessor.from_pretrained("CIDAS/clipseg-rd64-refined")
-            self.segment_model = CLIPSegForImageSegmentation.from_pretrained("CIDAS/clipseg-rd64-refined")
-            self.depth_pipe = pipeline(task="depth-estimation", model="depth-anything/Depth-Anything-V2-Small-hf")
-            print("Models Loaded.")
-
-    def _get_slope_map(self, depth_map):
-        dy, dx = np.gradient(depth_map)
-        slope_magnitude = np.sqrt(dx**2 + dy**2)
-        return slope_magnitude / (np.max(slope_magnitude) + 1e-8)
-
-    def _process_full_image(self, image_path, labels):
+        with self._load_lock:
+            if self.segment_model is None:
+                print("Loading CLIPSeg and Depth Models...")
+                with span("tiles.load_models", backend=self.backend):
+                    self.processor = CLIPSegProcessor.from_pretrained(self.SEGMENT_MODEL_ID)
+                    segment_model = CLIPSegForImageSegmentation.from_pretrained(self.SEGMENT_MODEL_ID)
+                    depth_pipe = pipeline(task="depth-estimation", model=self.DEPTH_MODEL_ID)
+                    depth_pipe.model = backends.prepare(depth_pipe.model, self.backend)
+                    self.depth_pipe = depth_pipe
+                    self.segment_model = backends.prepare(segment_model, self.backend)
+                print(f"Models Loaded ({self.backend}).")
+
+    def inference_id(self):
+        # Identifies everything the raw maps depend on besides image and labels
+        inference_id = self.MODEL_IDS
+        if self.backend != "fp32":
+            inference_id += (f"backend:{self.backend}",)
+        if self.window_size:
+            inference_id += (f"window:{self.window_size}/{self.window_overlap}/anchored",)
+        return inference_id
+
+    @classmethod
+    def _get_slope_magnitude(cls, depth):
+        # Gradient magnitude of an 8-bit depth image scaled to 0-1, in float32
+        # and over bands of rows: np.gradient only reads one row either side,
+        # so each band plus that context gives the same result as a whole-map
+        # pass without its full-size float64 intermediates.
+        depth = np.asarray(depth)
+        height = depth.shape[0]
+        magnitude = np.empty(depth.shape, dtype=np.float32)
+        for r0 in range(0, height, cls.POSTPROCESS_BAND_ROWS):
+            r1 = min(r0 + cls.POSTPROCESS_BAND_ROWS, height)
+            lo, hi = max(r0 - 1, 0), min(r1 + 1, height)
+            dy, dx = np.gradient(np.asarray(depth[lo:hi], dtype=np.float32) / 255.0)
+            magnitude[r0:r1] = np.sqrt(dx**2 + dy**2)[r0 - lo:r1 - lo]
+        return magnitude
+
+    def _get_slope_map(self, depth):
+        slope_magnitude = self._get_slope_magnitude(depth)
+        slope_magnitude /= np.max(slope_magnitude) + 1e-8
+        return slope_magnitude
+
+    def _segment_logits(self, images, labels):
+        # Equivalent to CLIPSegForImageSegmentation(images=[image] * len(labels)),
+        # but the vision backbone runs once per image and only the light decoder
+        # runs per label, in chunks of prompt_batch_size prompts.
+        # Returns logits of shape (num_images, num_labels, height, width).
+        model = self.segment_model
+        with span("tiles.clipseg_preprocess"):
+            text_inputs = self.processor(text=labels, padding=True, return_tensors="pt")
+            image_inputs = self.processor(images=images, return_tensors="pt")
+
+        with torch.no_grad(), span("tiles.clipseg", images=len(images), labels=len(labels)):
+            conditional_embeddings = model.get_conditional_embeddings(
+                batch_size=len(labels),
+                input_ids=text_inputs["input_ids"],
+                attention_mask=text_inputs["attention_mask"],
+            )
+
+            vision_outputs = model.clip.vision_model(
+                pixel_values=image_inputs["pixel_values"], output_hidden_states=True
+            )
+            # +1 as the hidden states also include the initial embeddings
+            activations = [vision_outputs.hidden_states[i + 1] for i in model.extract_layers]
+
+            num_images = len(images)
+            chunks = []
+            for start in range(0, len(labels), self.prompt_batch_size):
+                chunk = conditional_embeddings[start:start + self.prompt_batch_size]
+                # Pair every image with every prompt of the chunk: (image, prompt) row-major
+                chunk_activations = [a.repeat_interleave(len(chunk), dim=0) for a in activations]
+                decoded = model.decoder(chunk_activations, chunk.repeat(num_images, 1)).logits
+                chunks.append(decoded.view(num_images, len(chunk), *decoded.shape[-2:]))
+
+        return torch.cat(chunks, dim=1)
+
+    def _estimate_depth(self, images, **kwargs):
+        with span("tiles.depth"):
+            return self.depth_pipe(images, **kwargs)
+
+    @staticmethod
+    def _with_thread_budget(num_threads, fn):
+        torch.set_num_threads(num_threads)
+        with torch.no_grad():
+            return fn()
+
+    def _run_models(self, segment_fn, depth_fn):
+        # Runs the independent segmentation and depth passes, side by side in
+        # concurrent mode, and returns both results.
+        if not self.concurrent:
+            return segment_fn(), depth_fn()
+
+        previous_threads = torch.get_num_threads()
+        default_budget = max(1, previous_threads // 2)
+        segment_threads = self.segment_threads or default_budget
+        depth_threads = self.depth_threads or default_budget
+
+        # torch.set_num_threads() is not scoped to the thread that calls it:
+        # threads started afterwards inherit the last value set, so the count
+        # is put back once both passes are done rather than left at a budget.
+        try:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="tilegen") as pool:
+                segment_future = pool.submit(self._with_thread_budget, segment_threads, segment_fn)
+                depth_future = pool.submit(self._with_thread_budget, depth_threads, depth_fn)
+                return segment_future.result(), depth_future.result()
+        finally:
+            torch.set_num_threads(previous_threads)
+
+    @staticmethod
+    def _index_dtype(num_labels):
+        return np.uint8 if num_labels <= 256 else np.uint16
+
+    @classmethod
+    def _upsample_argmax(cls, logits, height, width):
+        # Same labels as argmax(sigmoid(bilinear_upsample(logits))), streamed
+        # over bands of output rows so the full-resolution (num_labels, H, W)
+        # float tensor never exists. Sigmoid is monotonic and is skipped.
+        num_labels, low_h, _ = logits.shape
+        mat_map = np.empty((height, width), dtype=cls._index_dtype(num_labels))
+        scale = low_h / height
+
+        for r0 in range(0, height, cls.POSTPROCESS_BAND_ROWS):
+            r1 = min(r0 + cls.POSTPROCESS_BAND_ROWS, height)
+
+            # Source rows of this band, following torch's align_corners=False mapping
+            src = ((torch.arange(r0, r1, dtype=torch.float32) + 0.5) * scale - 0.5).clamp(min=0)
+            y0 = src.long()
+            y1 = (y0 + 1).clamp(max=low_h - 1)
+            lam = (src - y0).unsqueeze(1)
+
+            # Horizontal pass on the few low-res rows involved (height is unchanged)
+            lo, hi = int(y0[0]), int(y1[-1]) + 1
+            rows = torch.nn.functional.interpolate(
+                logits[None, :, lo:hi], size=(hi - lo, width), mode="bilinear"
+            )[0]
+
+            band = (1 - lam) * rows[:, y0 - lo] + lam * rows[:, y1 - lo]
+            mat_map[r0:r1] = torch.argmax(band, dim=0).numpy()
+
+        return mat_map
+
+    @staticmethod
+    def _window_starts(length, size, overlap):
+        if length <= size:
+            return [0]
+        stride = max(1, size - overlap)
+        starts = list(range(0, length - size, stride))
+        starts.append(length - size)
+        return starts
+
+    @staticmethod
+    def _window_ramp(length, overlap):
+        # Ramps from the window border up to 1 over `overlap` pixels
+        ramp = np.minimum(np.arange(length) + 1, length - np.arange(length))
+        return np.minimum(ramp / max(overlap, 1), 1.0).astype(np.float32)
+
+    @staticmethod
+    def _axis_blend(length, starts, ramp):
+        # A window's blend weight is the outer product of its row and column
+        # ramps, so the weight sums and the window with the largest weight at
+        # each pixel factor into per-axis arrays; nothing full-size is needed.
+        weight_sum = np.zeros(length, dtype=np.float32)
+        best = np.full(length, -1.0, dtype=np.float32)
+        owner = np.zeros(length, dtype=np.int64)
+        for i, start in enumerate(starts):
+            section = slice(start, start + len(ramp))
+            weight_sum[section] += ramp
+            closer = ramp > best[section]
+            owner[section][closer] = i
+            best[section][closer] = ramp[closer]
+        return weight_sum, owner
+
+    def _process_windowed(self, image, labels, progress=None):
+        # Memory: the source pixels and the two output maps are full size (PIL
+        # decodes whole images, not regions); logits, depth, gradients and
+        # blend weights exist for one batch of windows at a time.
+        img_w, img_h = image.size
+        win_w = min(self.window_size, img_w)
+        win_h = min(self.window_size, img_h)
+        starts_y = self._window_starts(img_h, win_h, self.window_overlap)
+        starts_x = self._window_starts(img_w, win_w, self.window_overlap)
+        windows = [(iy, ix) for iy in range(len(starts_y)) for ix in range(len(starts_x))]
+        ramp_y = self._window_ramp(win_h, self.window_overlap)
+        ramp_x = self._window_ramp(win_w, self.window_overlap)
+        sum_y, owner_y = self._axis_blend(img_h, starts_y, ramp_y)
+        sum_x, owner_x = self._axis_blend(img_w, starts_x, ramp_x)
+        print(f"Running windowed inference over {len(windows)} windows...")
+
+        mat_map = np.zeros((img_h, img_w), dtype=self._index_dtype(len(labels)))
+        slope_map = np.zeros((img_h, img_w), dtype=np.float32)
+        blended = []
+
+        for start in range(0, len(windows), self.window_batch_size):
+            if progress: progress(f"Segmenting window {start + 1}/{len(windows)}", 0.05 + 0.75 * start / len(windows))
+            batch = windows[start:start + self.window_batch_size]
+            crops = [image.crop((starts_x[ix], starts_y[iy], starts_x[ix] + win_w, starts_y[iy] + win_h))
+                     for iy, ix in batch]
+
+            batch_logits, depth_results = self._run_models(
+                lambda: self._segment_logits(crops, labels),
+                lambda: self._estimate_depth(crops, batch_size=len(crops)),
+            )
+
+            for (iy, ix), logits, depth_result in zip(batch, batch_logits, depth_results):
+                y0, x0 = starts_y[iy], starts_x[ix]
+                rows, cols = slice(y0, y0 + win_h), slice(x0, x0 + win_w)
+
+                # Labels come from the window whose centre is closest to the pixel
+                owned = np.ix_(owner_y[rows] == iy, owner_x[cols] == ix)
+                mat_map[rows, cols][owned] = self._upsample_argmax(logits, win_h, win_w)[owned]
+
+                # Each window's depth is normalized on its own, so its gradients
+                # are only known up to a scale; that scale is fitted to the
+                # windows already blended where they overlap. Gradients rather
+                # than depths are blended, so depth offsets do not matter.
+                gradient = self._get_slope_magnitude(depth_result["depth"])
+                weight = np.outer(ramp_y / sum_y[rows], ramp_x / sum_x[cols])
+                covered = np.zeros_like(weight)
+                for jy, jx in blended:
+                    oy0, ox0 = starts_y[jy], starts_x[jx]
+                    ys = slice(max(y0, oy0), min(y0, oy0) + win_h)
+                    xs = slice(max(x0, ox0), min(x0, ox0) + win_w)
+                    if ys.start < ys.stop and xs.start < xs.stop:
+                        covered[ys.start - y0:ys.stop - y0, xs.start - x0:xs.stop - x0] += np.outer(
+                            ramp_y[ys.start - oy0:ys.stop - oy0] / sum_y[ys],
+                            ramp_x[xs.start - ox0:xs.stop - ox0] / sum_x[xs])
+                # Weighted least squares of covered * (scale * gradient) against
+                # what the earlier windows put there
+                fit = np.sum(covered * gradient ** 2)
+                scale = np.sum(slope_map[rows, cols] * gradient) / fit if fit > 1e-12 else 1.0
+                slope_map[rows, cols] += weight * (scale * gradient)
+                blended.append((iy, ix))
+
+        slope_map /= np.max(slope_map) + 1e-8
+
+        return image, mat_map, slope_map
+
+    def _process_full_image(self, image, labels, progress=None):
+        if progress: progress("Loading models", 0.0)
         self._load_models()
         print("Running AI Inference...")
-        image = Image.open(image_path).convert("RGB")
-        original_size = image.size 
-        
-        inputs = self.processor(text=labels, images=[image] * len(labels), padding=True, return_tensors="pt")
-        with torch.no_grad():
-            outputs = self.segment_model(**inputs)
-        logits = outputs.logits.detach().cpu()
-        
-        # logits shape: (num_labels, height, width) or (height, width) if 1 label
-        if len(labels) == 1:
-            logits = logits.unsqueeze(0)
-            
-        logits_resized = torch.nn.functional.interpolate(
-            logits.unsqueeze(1), size=(original_size[1], original_size[0]), mode="bilinear"
-        ).squeeze(1)
-        
-        mat_map = torch.argmax(torch.sigmoid(logits_resized), dim=0).numpy()
+        if progress: progress("Decoding image", 0.02)
+        decoded = DecodedImage.of(image)
+        original_size = decoded.size
+
+        if self.window_size and max(original_size) > self.window_size:
+            # Windows are cut from the full-resolution image
+            _, mat_map, slope_map = self._process_windowed(decoded.rgb(), labels, progress)
+            return decoded, mat_map, slope_map
+
+        # Larger request first, so the second is served from the same decode
+        depth_image = decoded.rgb(self.DEPTH_MIN_SIDE)
+        segment_image = decoded.rgb(self.SEGMENT_MIN_SIDE)
+
+        if progress: progress("Segmenting and estimating depth", 0.05)
+        batch_logits, depth_result = self._run_models(
+            lambda: self._segment_logits([segment_image], labels),
+            lambda: self._estimate_depth(depth_image),
+        )
+
+        # logits shape: (num_labels, height, width)
+        logits = batch_logits[0]
+        with span("tiles.upsample_argmax"):
+            mat_map = self._upsample_argmax(logits, original_size[1], original_size[0])
         
-        depth_result = self.depth_pipe(image)
-        depth_map = np.array(depth_result["depth"]) / 255.0
-        slope_map = self._get_slope_map(depth_map)
+        with span("tiles.slope"):
+            depth = depth_result["depth"]
+            if depth.size != original_size:
+                depth = depth.resize(original_size, Image.BILINEAR)
+            slope_map = self._get_slope_map(depth)
         
-        return image, mat_map, slope_map
+        return decoded, mat_map, slope_map
 
     @staticmethod
-    def analyze_tile_logic(composition, slope_val, label_configs, walkability_threshold):
-        if not composition:
-            return False, "no_data", "none"
-            
-        dominant_label = max(composition, key=composition.get)
-        mat_config = label_configs.get(dominant_label, {"walkable": False, "slope_tolerance": 0.1})
-
-        walkable_ratio = 0.0
-        for label, percent in composition.items():
-            px_conf = label_configs.get(label, {"walkable": False})
-            if px_conf["walkable"]:
-                walkable_ratio += percent
-
-        is_material_walkable = walkable_ratio >= walkability_threshold
-
-        dynamic_limit = mat_config["slope_tolerance"]
-        is_physically_steep = slope_val > dynamic_limit
-        
-        if not is_material_walkable:
-            return False, "bad_material", dominant_label
-        elif is_physically_steep:
-            return False, "steep_slope", dominant_label
-        else:
-            return True, "none", dominant_label
-
-    def generate(self, image_path, labels, rows, cols, label_configs=None, walkability_threshold=0.4):
+    def _pack_maps(mat_map, slope_map):
+        # Grid-independent inference output, compressed for storage: label
+        # indices as uint8 (uint16 past 256 labels) and the slope as float16.
+        index_dtype = np.uint8 if mat_map.max(initial=0) < 256 else np.uint16
+        with io.BytesIO() as bio:
+            np.savez_compressed(bio, mat_map=mat_map.astype(index_dtype), slope_map=slope_map.astype(np.float16))
+            return bio.getvalue()
+
+    @staticmethod
+    def _unpack_maps(payload):
+        with np.load(io.BytesIO(payload), allow_pickle=False) as arrays:
+            return arrays["mat_map"], arrays["slope_map"].astype(np.float32)
+
+    @staticmethod
+    def _tile_statistics(mat_map, slope_map, rows, cols, num_labels):
+        # Per-tile label pixel counts (rows, cols, num_labels) and the max slope
+        # of each tile's "inner sanctum" (rows, cols), computed on a
+        # (rows, tile_h, cols, tile_w) block view instead of a per-tile loop.
+        img_h, img_w = mat_map.shape
+        tile_w = img_w // cols
+        tile_h = img_h // rows
+        if tile_w == 0 or tile_h == 0:
+            return np.zeros((0, 0, num_labels), dtype=np.int64), np.zeros((0, 0))
+
+        mat_blocks = mat_map[:rows * tile_h, :cols * tile_w].reshape(rows, tile_h, cols, tile_w)
+        slope_blocks = slope_map[:rows * tile_h, :cols * tile_w].reshape(rows, tile_h, cols, tile_w)
+
+        # Label histograms of all tiles in one bincount over (tile, label) ids
+        tile_ids = (np.arange(rows, dtype=np.int64)[:, None, None, None] * cols
+                    + np.arange(cols, dtype=np.int64)[None, None, :, None]) * num_labels
+        counts = np.bincount((tile_ids + mat_blocks).ravel(), minlength=rows * cols * num_labels)
+        counts = counts[:rows * cols * num_labels].reshape(rows, cols, num_labels)
+
+        # Inner Sanctum logic: ignore a 25% margin unless nothing would be left
+        margin_x = max(1, int(tile_w * 0.25))
+        margin_y = max(1, int(tile_h * 0.25))
+        if tile_h - margin_y > margin_y and tile_w - margin_x > margin_x:
+            slope_blocks = slope_blocks[:, margin_y:tile_h - margin_y, :, margin_x:tile_w - margin_x]
+        max_slopes = slope_blocks.max(axis=(1, 3))
+
+        return counts, max_slopes
+
+    analyze_tile_logic = staticmethod(tile_logic.analyze_tile_logic)
+    evaluate_grid = staticmethod(tile_logic.evaluate_grid)
+
+    def _render_maps(self, mat_map, slope_map, labels):
+        # The original image is not rendered: its stored bytes serve as the
+        # "original" map, so a second copy is neither made nor cached
+        maps = {}
         try:
-            image, mat_map, slope_map = self._process_full_image(image_path, labels)
-            img_w, img_h = image.size
-            tile_w = img_w // cols
-            tile_h = img_h // rows
-
-            tile_data = []
-            
-            if label_configs is None:
-                label_configs = {} 
-
-            print("Generating Level Data...")
-            for row in range(rows):
-                for col in range(cols):
-                    
-                    # Define Tile Area
-                    x0, y0 = col * tile_w, row * tile_h
-                    x1, y1 = x0 + tile_w, y0 + tile_h
-                    
-                    # Extract Data
-                    tile_mat = mat_map[y0:y1, x0:x1]
-                    tile_slope = slope_map[y0:y1, x0:x1]
-                    
-                    if tile_mat.size == 0: continue
-
-                    unique, counts = np.unique(tile_mat, return_counts=True)
-                    counts_dict = dict(zip(unique, counts))
-                    total_pixels = tile_mat.size
-                    
-                    composition = {}
-                    
-                    for idx, label in enumerate(labels):
-                        count = counts_dict.get(idx, 0)
-                        if count > 0:
-                            percent = round(count / total_pixels, 3)
-                            composition[label] = percent
-                    
-                    # Inner Sanctum logic
-                    margin_x = max(1, int(tile_w * 0.25))
-                    margin_y = max(1, int(tile_h * 0.25))
-                    inner_slope = tile_slope[margin_y:-margin_y, margin_x:-margin_x]
-                    if inner_slope.size == 0: inner_slope = tile_slope
-                    
-                    max_slope_val = float(np.max(inner_slope))
-                    
-                    walkable, block_reason, dominant = self.analyze_tile_logic(
-                        composition, max_slope_val, label_configs, walkability_threshold
-                    )
-
-                    tile_entry = {
-                        "id": f"tile_{col}_{row}",
-                        "grid_pos": [col, row],
-                        "world_pos": [x0, y0],
-                        "composition": composition, 
-                        "slope_val": round(max_slope_val, 3),
-                        "walkable": walkable,
-                        "block_reason": block_reason,
-                        "dominant": dominant
-                    }
-                    tile_data.append(tile_entry)
-            
-            maps = {}
-            try:
-                with io.BytesIO() as bio:
-                    image.save(bio, format="PNG")
-                    maps["original"] = bio.getvalue()
+            # Material Map (Colored, one stable palette colour per label)
+            pil_mat = colorize(mat_map, labels)
+            with io.BytesIO() as bio:
+                pil_mat.save(bio, format="PNG")
+                maps["material"] = bio.getvalue()
+
+            # Slope Map (Grayscale)
+            slope_uint8 = (slope_map * 255).astype(np.uint8)
+            pil_slope = Image.fromarray(slope_uint8, mode="L")
+            with io.BytesIO() as bio:
+                pil_slope.save(bio, format="PNG")
+                maps["slope"] = bio.getvalue()
+        except Exception as e:
+            print(f"Map generation warning: {e}")
+
+        return maps
+
+    def _build_grid(self, mat_map, slope_map, labels, rows, cols, label_configs, walkability_threshold):
+        img_h, img_w = mat_map.shape
+        tile_w = img_w // cols
+        tile_h = img_h // rows
+
+        counts, max_slopes = self._tile_statistics(mat_map, slope_map, rows, cols, len(labels))
+        total_pixels = tile_w * tile_h
+
+        # Per-mille composition, offset by one so present-but-0.0% labels survive
+        percents = np.round(counts / max(total_pixels, 1), 3)
+        composition = np.where(counts > 0, np.rint(percents * 1000) + 1, 0).astype(np.uint16)
 
-                # Material Map (Colored)
-                if mat_map.max() > 0:
-                    norm_mat = mat_map / (mat_map.max() + 1e-8)
+        # Walkability is decided on the slopes exactly as stored, which the
+        # preview re-evaluates later; only the tile dicts round them
+        max_slopes = max_slopes.astype(np.float32)
+        walkable, block_reason, dominant = self.evaluate_grid(
+            composition, max_slopes, labels, label_configs, walkability_threshold
+        )
+        return TileGrid(
+            labels, composition, max_slopes,
+            dominant=dominant, walkable=walkable, block_reason=block_reason,
+            tile_size=(tile_w, tile_h),
+        )
+
+    def generate(self, image, labels, rows, cols, label_configs=None, walkability_threshold=0.4, map_cache=None,
+                 progress=None):
+        # map_cache holds the packed inference maps ("maps") and their rendered
+        # PNGs ("renders") for this image/label list; when present the models
+        # are skipped and only the tiling is redone (and image is never decoded).
+        # image is anything DecodedImage accepts. progress(stage, fraction) is
+        # called as each stage starts; whatever it raises (a cancelled job's
+        # JobCancelled, say) propagates instead of counting as a failure.
+        callback_errors = []
+        if progress is not None:
+            report = progress
+
+            def progress(stage, fraction=None):
+                try:
+                    report(stage, fraction)
+                except Exception as e:
+                    callback_errors.append(e)
+                    raise
+
+        with span("generate", labels=len(labels), rows=rows, cols=cols):
+            try:
+                if map_cache and "maps" in map_cache:
+                    print("Using cached inference maps...")
+                    mat_map, slope_map = self._unpack_maps(map_cache["maps"])
+                    maps = dict(map_cache.get("renders", {}))
                 else:
-                    norm_mat = mat_map
-                
-                # Use a colormap (e.g., 'tab10' or 'viridis')
-                cmap = cm.get_cmap('tab10')
-                colored_mat = cmap(norm_mat) # Returns RGBA
-                # Convert to PIL (uint8)
-                colored_mat_uint8 = (colored_mat[:, :, :3] * 255).astype(np.uint8)
-                pil_mat = Image.fromarray(colored_mat_uint8)
-                with io.BytesIO() as bio:
-                    pil_mat.save(bio, format="PNG")
-                    maps["material"] = bio.getvalue()
-
-                # Slope Map (Grayscale)
-                slope_uint8 = (slope_map * 255).astype(np.uint8)
-                pil_slope = Image.fromarray(slope_uint8, mode="L")
-                with io.BytesIO() as bio:
-                    pil_slope.save(bio, format="PNG")
-                    maps["slope"] = bio.getvalue()
-            except Exception as e:
-                print(f"Map generation warning: {e}")
+                    _, mat_map, slope_map = self._process_full_image(image, labels, progress)
+                    # Tile from the same quantized maps a later cached run would see
+                    with span("tiles.pack_maps"):
+                        packed = self._pack_maps(mat_map, slope_map)
+                        mat_map, slope_map = self._unpack_maps(packed)
+                    if progress: progress("Rendering maps", 0.8)
+                    with span("tiles.render_maps"):
+                        maps = self._render_maps(mat_map, slope_map, labels)
+                    if map_cache is not None:
+                        map_cache["maps"] = packed
+                        map_cache["renders"] = maps
 
-            return {
-                "config": {"rows": rows, "cols": cols},
-                "data": tile_data,
-                "maps": maps
-            }
+                if label_configs is None:
+                    label_configs = {} 
 
-        except Exception as e:
-            print(f"Error in generate: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+                print("Generating Level Data...")
+                if progress: progress("Tiling", 0.9)
+                with span("tiles.tiling"):
+                    grid = self._build_grid(mat_map, slope_map, labels, rows, cols, label_configs, walkability_threshold)
+
+                return {
+                    "config": {"rows": rows, "cols": cols},
+                    "grid": grid,
+                    "maps": maps
+                }
+
+            except Exception as e:
+                if callback_errors:
+                    raise
+                print(f"Error in generate: {e}")
+                import traceback
+                traceback.print_exc()
+                return None
@@ -0,0 +1,67 @@
+import numpy as np
+
+from core.models import BLOCK_REASONS
+
+# Walkability rules shared by TileGenerator, the tile preview and remote
+# clients. numpy only, so importing it does not pull in torch.
+
+def analyze_tile_logic(composition, slope_val, label_configs, walkability_threshold):
+    if not composition:
+        return False, "no_data", "none"
+
+    dominant_label = max(composition, key=composition.get)
+    mat_config = label_configs.get(dominant_label, {"walkable": False, "slope_tolerance": 0.1})
+
+    walkable_ratio = 0.0
+    for label, percent in composition.items():
+        px_conf = label_configs.get(label, {"walkable": False})
+        if px_conf["walkable"]:
+            walkable_ratio += percent
+
+    is_material_walkable = walkable_ratio >= walkability_threshold
+
+    dynamic_limit = mat_config["slope_tolerance"]
+    is_physically_steep = slope_val > dynamic_limit
+
+    if not is_material_walkable:
+        return False, "bad_material", dominant_label
+    elif is_physically_steep:
+        return False, "steep_slope", dominant_label
+    else:
+        return True, "none", dominant_label
+
+
+def evaluate_grid(composition, slope, labels, label_configs, walkability_threshold):
+    # analyze_tile_logic for a whole TileGrid in one pass. composition is the
+    # grid's (rows, cols, L) per-mille+1 array and slope a (rows, cols)
+    # array; returns walkable, block reason codes (see BLOCK_REASONS) and
+    # dominant label indices (-1 for none) as (rows, cols) arrays.
+    present = composition > 0
+    percents = np.maximum(composition.astype(np.int64) - 1, 0) / 1000
+
+    default = {"walkable": False, "slope_tolerance": 0.1}
+    label_walkable = [label_configs.get(label, default)["walkable"] for label in labels]
+    tolerances = np.array([label_configs.get(label, default)["slope_tolerance"] for label in labels] + [0.0])
+
+    # Accumulated label by label, like the per-tile loop, so rounding matches
+    walkable_ratio = np.zeros(slope.shape)
+    for idx, label_is_walkable in enumerate(label_walkable):
+        if label_is_walkable:
+            walkable_ratio += np.where(present[..., idx], percents[..., idx], 0.0)
+
+    # First maximum among present labels, like max() over the composition dict
+    has_data = present.any(axis=-1)
+    dominant = np.full(slope.shape, -1, dtype=np.int64)
+    if labels:
+        dominant[has_data] = np.argmax(np.where(present, percents, -1.0), axis=-1)[has_data]
+
+    is_material_walkable = walkable_ratio >= walkability_threshold
+    is_physically_steep = slope > tolerances[dominant]
+
+    block_reason = np.full(slope.shape, BLOCK_REASONS.index("none"), dtype=np.uint8)
+    block_reason[is_physically_steep] = BLOCK_REASONS.index("steep_slope")
+    block_reason[~is_material_walkable] = BLOCK_REASONS.index("bad_material")
+    block_reason[~has_data] = BLOCK_REASONS.index("no_data")
+
+    walkable = block_reason == BLOCK_REASONS.index("none")
+    return walkable, block_reason, dominant.astype(np.int16)
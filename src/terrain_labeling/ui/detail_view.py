@@ -2,17 +2,21 @@ import customtkinter as ctk
 from tkinter import messagebox, filedialog
 from PIL import Image
 import io
-import threading
-import tempfile
-import os
+import queue
+from core.models import get_tile_grid
+from core.export import build_tile_export
+from ml.tile_logic import evaluate_grid
+from ml.image_io import DecodedImage
+from ml.job_scheduler import JobCancelled
+from ui.tile_preview import TilePreviewRenderer
 
 class DetailView(ctk.CTkFrame):
-    def __init__(self, parent, db, on_back, label_selector, tile_generator):
+    def __init__(self, parent, db, on_back, models, scheduler):
         super().__init__(parent)
         self.db = db
         self.on_back = on_back
-        self.label_selector = label_selector
-        self.tile_generator = tile_generator
+        self.models = models
+        self.scheduler = scheduler
         self.current_image_name = None
 
         self.grid_columnconfigure(1, weight=1)
@@ -74,6 +78,8 @@ class DetailView(ctk.CTkFrame):
 
         self.btn_analyze = ctk.CTkButton(self.tab_get_labels, text="Get Relevant Labels", command=self.analyze_image)
         self.btn_analyze.pack(pady=10)
+        self.lbl_analysis_status = ctk.CTkLabel(self.tab_get_labels, text="")
+        self.lbl_analysis_status.pack()
 
         ctk.CTkLabel(self.tab_get_labels, text="Relevant Labels", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=(20, 5))
         self.results_frame = ctk.CTkScrollableFrame(self.tab_get_labels, height=300)
@@ -112,7 +118,7 @@ class DetailView(ctk.CTkFrame):
         self.lbl_gen_labels = ctk.CTkLabel(self.tab_gen_tile, text="", font=ctk.CTkFont(size=12), wraplength=400)
         self.lbl_gen_labels.pack(pady=10)
 
-        self.map_data = {}
+        self.map_data = set()
         self.map_keys = ["original", "material", "slope"]
         self.current_map_index = 0
 
@@ -142,12 +148,31 @@ class DetailView(ctk.CTkFrame):
 
         self.detail_image_label.bind("<Motion>", self.on_image_hover)
 
+        self._decoded = None
+        self.preview_grid = None
+        self.preview_renderer = TilePreviewRenderer(evaluate_grid)
+        self._label_configs = {}
+        self._label_configs_version = None
+        self.last_hovered_tile = None
+
+    # Created by the ModelLoader on first use (or by its background warm-up)
+    @property
+    def label_selector(self):
+        return self.models.label_selector
+
+    @property
+    def tile_generator(self):
+        return self.models.tile_generator
+
     def update_preview_threshold(self, value):
         self.lbl_threshold_val.configure(text=f"{value:.2f}")
         self.update_preview()
 
     def load_image(self, image_name):
         self.current_image_name = image_name
+        # Running jobs hold their own reference to the previous image's decode
+        if self._decoded is not None and self._decoded[0][0] != image_name:
+            self._decoded = None
         
         # Reset UI State
         self.entry_top_k.delete(0, "end")
@@ -166,6 +191,7 @@ class DetailView(ctk.CTkFrame):
         self.entry_cols.insert(0, "20")
         self.lbl_gen_labels.configure(text="")
         self.lbl_gen_status.configure(text="")
+        self.lbl_analysis_status.configure(text="")
         self.lbl_tile_stats.configure(text="")
         self.lbl_tile_pos.configure(text="Hover over image...")
         self.check_show_grid.deselect()
@@ -176,14 +202,11 @@ class DetailView(ctk.CTkFrame):
         img_model = self.db.get_image(image_name)
         if not img_model: return
 
-        self.original_image_data = img_model.data
-        
-        # Cache resized base image
-        image_data = io.BytesIO(self.original_image_data)
+        # Cache resized base image (precomputed 600px preview)
+        image_data = io.BytesIO(self.db.get_thumbnail(image_name, 600))
         self.base_pil_image = Image.open(image_data).convert("RGB")
-        self.base_pil_image.thumbnail((600, 600))
         
-        self.last_hovered_tile = None
+        self._refresh_preview_data(img_model)
         
         self.update_preview()
 
@@ -204,6 +227,8 @@ class DetailView(ctk.CTkFrame):
         else:
             self.lbl_gen_status.configure(text="No tile data generated.", text_color="gray")
 
+        self._update_job_buttons()
+
     def update_gen_tab_state(self):
         img_model = self.db.get_image(self.current_image_name)
         if not img_model: return
@@ -216,12 +241,12 @@ class DetailView(ctk.CTkFrame):
             self.btn_generate_tiles.configure(state="disabled")
             self.lbl_gen_labels.configure(text="No labels found. Please run 'Get Image Labels' first.", text_color="red")
 
-        # Check for maps
-        tile_data = getattr(img_model, 'tile_data', None)
-        if tile_data and 'maps' in tile_data:
-            self.map_data = tile_data['maps']
-        else:
-            self.map_data = {}
+        # Check for maps (names only; the PNGs are read from blobs on display).
+        # The image itself is the "original" map.
+        self.map_data = set(getattr(img_model, 'maps', None) or {})
+        if self.map_data:
+            self.map_data.add("original")
+        self._refresh_preview_data(img_model)
         
         self.update_preview()
 
@@ -236,129 +261,53 @@ class DetailView(ctk.CTkFrame):
     def on_image_hover(self, event):
         if self.tabview.get() != "Tile Data Preview":
             return
-        
-        img_model = self.db.get_image(self.current_image_name)
-        tile_data = getattr(img_model, 'tile_data', None)
-        if not img_model or not tile_data:
+        if not self.preview_grid or not hasattr(self, 'base_pil_image'):
             return
 
-        if not hasattr(self, 'base_pil_image'): return
-
-        w, h = self.base_pil_image.size
-        
-        rows = 20
-        cols = 20
-        tile_data_map = {}
-        
-        if tile_data and 'data' in tile_data:
-            try:
-                data_list = tile_data['data']
-                cols = max(d['grid_pos'][0] for d in data_list) + 1
-                rows = max(d['grid_pos'][1] for d in data_list) + 1
-                for d in data_list:
-                    tile_data_map[tuple(d['grid_pos'])] = d
-            except: pass
-        
-        tile_w = w / cols
-        tile_h = h / rows
-        
-        col = int(event.x // tile_w)
-        row = int(event.y // tile_h)
-        
-        col = max(0, min(col, cols - 1))
-        row = max(0, min(row, rows - 1))
+        row, col = self.preview_renderer.tile_at(event.x, event.y)
         
         if self.last_hovered_tile != (row, col):
             self.last_hovered_tile = (row, col)
             self.lbl_tile_pos.configure(text=f"Row: {row}, Col: {col}")
             
-            # Update visuals with highlight
-            self._update_tile_visuals(rows, cols, highlight_row=row, highlight_col=col)
+            # Update visuals with highlight (re-evaluates the grid if the slider moved)
+            self._update_tile_visuals(highlight=(row, col))
             
-            if (col, row) in tile_data_map:
-                data = tile_data_map[(col, row)]
-                
-                # Re-calculate status for display based on current slider
-                threshold = self.slider_threshold.get()
-                all_labels = self.db.get_all_labels()
-                label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
-                
-                walkable, reason, dominant = self.tile_generator.analyze_tile_logic(
-                    data['composition'], data['slope_val'], label_configs, threshold
-                )
-                
-                status_str = "WALKABLE" if walkable else f"BLOCKED ({reason})"
-                comp_str = "\n".join([f"{k}: {v:.1%}" for k, v in data['composition'].items()])
-                stats_text = f"Status: {status_str}\nSlope: {data['slope_val']}\nDominant: {dominant}\n\nComposition:\n{comp_str}"
-            else:
-                stats_text = "No Data"
+            data = self.preview_grid.tile(col, row)
+            walkable, reason, dominant = self.preview_renderer.tile_status(row, col)
+            
+            # The stored float32 slope the walkability status was evaluated on,
+            # not the rounded slope_val of the export format
+            slope = float(self.preview_grid.slope[row, col])
+            status_str = "WALKABLE" if walkable else f"BLOCKED ({reason})"
+            comp_str = "\n".join([f"{k}: {v:.1%}" for k, v in data['composition'].items()])
+            stats_text = f"Status: {status_str}\nSlope: {slope:.4f}\nDominant: {dominant}\n\nComposition:\n{comp_str}"
             
             self.lbl_tile_stats.configure(text=stats_text)
 
-    def _get_visualization_data(self):
-        img_model = self.db.get_image(self.current_image_name)
-        tile_data = getattr(img_model, 'tile_data', None)
-        tile_data_map = {}
-        if tile_data and 'data' in tile_data:
-            for d in tile_data['data']:
-                tile_data_map[tuple(d['grid_pos'])] = d
-        return tile_data_map
+    def _refresh_preview_data(self, img_model):
+        # The grid and the renderer's cached overlay only change with new tile data
+        self.preview_grid = get_tile_grid(getattr(img_model, 'tile_data', None))
+        self.preview_renderer.reset(getattr(self, 'base_pil_image', None), self.preview_grid)
+        self.last_hovered_tile = None
 
     def _get_visualization_configs(self):
         threshold = self.slider_threshold.get()
-        all_labels = self.db.get_all_labels()
-        label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
-        return threshold, label_configs
-
-    def _draw_tile_overlay(self, draw, x, y, tile_w, tile_h, data, label_configs, threshold):
-        walkable, reason, _ = self.tile_generator.analyze_tile_logic(
-            data['composition'], data['slope_val'], label_configs, threshold
-        )
-        
-        if not walkable:
-            if reason == "steep_slope":
-                color = "red"
-                width = 2
-                draw.line([x, y, x + tile_w, y + tile_h], fill=color, width=width)
-                draw.line([x, y + tile_h, x + tile_w, y], fill=color, width=width)
-            else:
-                color = "orange"
-                width = 2
-                draw.rectangle([x, y, x + tile_w, y + tile_h], outline=color, width=width)
-                draw.line([x, y, x + tile_w, y + tile_h], fill=color, width=width)
-        else:
-            draw.rectangle([x, y, x + tile_w, y + tile_h], outline="#00FF00", width=1)
-
-    def _update_tile_visuals(self, rows, cols, highlight_row=-1, highlight_col=-1):
-        img_copy = self.base_pil_image.copy()
-        from PIL import ImageDraw
-        draw = ImageDraw.Draw(img_copy, "RGBA")
-        
-        w, h = img_copy.size
-        tile_w = w / cols
-        tile_h = h / rows
-        
-        tile_data_map = self._get_visualization_data()
-        threshold, label_configs = self._get_visualization_configs()
-
-        # Draw Tiles
-        for r in range(rows):
-            for c in range(cols):
-                if (c, r) in tile_data_map:
-                    x = c * tile_w
-                    y = r * tile_h
-                    self._draw_tile_overlay(draw, x, y, tile_w, tile_h, tile_data_map[(c, r)], label_configs, threshold)
+        if self._label_configs_version != self.db.labels_version:
+            all_labels = self.db.get_all_labels()
+            self._label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
+            self._label_configs_version = self.db.labels_version
+        return threshold, self._label_configs, self._label_configs_version
 
-        if highlight_row >= 0 and highlight_col >= 0:
-            hx = highlight_col * tile_w
-            hy = highlight_row * tile_h
-            draw.rectangle([hx, hy, hx + tile_w, hy + tile_h], fill=(255, 255, 255, 100))
+    def _update_tile_visuals(self, highlight=None):
+        threshold, label_configs, version = self._get_visualization_configs()
+        img = self.preview_renderer.render(threshold, label_configs, version, highlight=highlight)
 
-        ctk_image = ctk.CTkImage(light_image=img_copy, dark_image=img_copy, size=img_copy.size)
+        ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
         self.detail_image_label.configure(image=ctk_image)
 
     def update_preview(self):
-        if not hasattr(self, 'original_image_data'): return
+        if not hasattr(self, 'base_pil_image'): return
         
         current_tab = self.tabview.get()
 
@@ -386,9 +335,11 @@ class DetailView(ctk.CTkFrame):
                 key = self.map_keys[self.current_map_index]
                 if key in self.map_data:
                     try:
-                        img_bytes = self.map_data[key]
-                        pil_image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                        pil_image.thumbnail((600, 600))
+                        # The original is the 600px preview already in pil_image
+                        if key != "original":
+                            img_bytes = self.db.get_image_map(self.current_image_name, key)
+                            pil_image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+                            pil_image.thumbnail((600, 600))
                         
                         titles = {"original": "Original Image", "material": "Material Map", "slope": "Slope Map"}
                         self.lbl_overlay_title.configure(text=titles.get(key, key.capitalize()))
@@ -410,10 +361,7 @@ class DetailView(ctk.CTkFrame):
             self.detail_image_label.configure(image=ctk_image)
         
         elif current_tab == "Tile Data Preview":
-             img_model = self.db.get_image(self.current_image_name)
-             tile_data = getattr(img_model, 'tile_data', None)
-             
-             if not tile_data:
+             if not self.preview_grid:
                  # Disable preview
                  self.lbl_no_preview.place(relx=0.5, rely=0.5, anchor="center")
                  self.slider_threshold.pack_forget()
@@ -432,14 +380,7 @@ class DetailView(ctk.CTkFrame):
              self.slider_threshold.pack(pady=5, padx=20, fill="x")
              self.btn_download_json.pack(pady=10, side="bottom")
 
-             rows, cols = 20, 20
-             if tile_data and 'data' in tile_data:
-                 try:
-                    data_list = tile_data['data']
-                    cols = max(d['grid_pos'][0] for d in data_list) + 1
-                    rows = max(d['grid_pos'][1] for d in data_list) + 1 
-                 except: pass
-             self._update_tile_visuals(rows, cols)
+             self._update_tile_visuals()
         
         else:
             self.lbl_no_preview.place_forget()
@@ -488,40 +429,109 @@ class DetailView(ctk.CTkFrame):
         all_labels = self.db.get_all_labels()
         label_configs = {l.name: {"walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels}
         
-        self.btn_generate_tiles.configure(state="disabled", text="Generating...")
-        self.lbl_gen_status.configure(text="Starting generation...", text_color="blue")
-        self.update_idletasks()
-        
-        threading.Thread(target=self._run_tile_gen_thread, args=(labels, rows, cols, label_configs)).start()
+        # A remote generator asks the inference server for its inference id, so
+        # that happens in a job; the cached maps are then read on the Tk thread
+        image_name = self.current_image_name
+        if self._submit_job(image_name, "generate", lambda job: self.tile_generator.inference_id(),
+                            lambda job, inference_id, error: self._start_generation(job, inference_id, error, labels,
+                                                                                    rows, cols, label_configs)):
+            self.lbl_gen_status.configure(text="Queued...", text_color="blue")
+
+    def _start_generation(self, job, inference_id, error, labels, rows, cols, label_configs):
+        image_name = job.image_id
+        if error is not None or job.cancelled or not self.db.get_image(image_name):
+            self._on_tile_gen_complete(job, None, error or JobCancelled(), labels, inference_id, None)
+            return
 
-    def _run_tile_gen_thread(self, labels, rows, cols, label_configs):
-        img_model = self.db.get_image(self.current_image_name)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-            tmp.write(img_model.data)
-            tmp_path = tmp.name
+        map_cache = self.db.get_inference_maps(image_name, labels, inference_id)
+        image = self._decoded_image(image_name)
 
-        try:
-            result = self.tile_generator.generate(tmp_path, labels, rows, cols, label_configs=label_configs)
-        except Exception as e:
-            print(f"Gen Error: {e}")
-            result = None
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        
-        self.after(0, lambda: self._on_tile_gen_complete(result))
+        def run(job):
+            return self.tile_generator.generate(image, labels, rows, cols, label_configs=label_configs,
+                                                map_cache=map_cache, progress=job.progress)
+
+        if not self._submit_job(image_name, "generate", run,
+                                lambda job, result, error: self._on_tile_gen_complete(job, result, error, labels,
+                                                                                      inference_id, map_cache)):
+            self._on_tile_gen_complete(job, None, JobCancelled(), labels, inference_id, None)
+
+    def _on_tile_gen_complete(self, job, result, error, labels, inference_id, map_cache):
+        image_name = job.image_id
+        if result:
+            self.db.store_inference_maps(image_name, labels, inference_id, map_cache)
+            self.db.update_image_tile_data(image_name, result)
+        elif error is not None and not isinstance(error, JobCancelled):
+            print(f"Gen Error: {error}")
+
+        # Results for an image that is no longer shown are only stored
+        if image_name != self.current_image_name:
+            return
 
-    def _on_tile_gen_complete(self, result):
-        self.btn_generate_tiles.configure(state="normal", text="Generate Tile Data")
         if result:
-            self.db.update_image_tile_data(self.current_image_name, result)
             self.lbl_gen_status.configure(text="Generation Complete!", text_color="green")
             self.update_gen_tab_state() # Update UI state
-            messagebox.showinfo("Success", "Tile data generated successfully.")
+        elif isinstance(error, JobCancelled):
+            self.lbl_gen_status.configure(text="Generation cancelled.", text_color="gray")
         else:
             self.lbl_gen_status.configure(text="Generation Failed.", text_color="red")
+        self._update_job_buttons()
+
+        if result:
+            messagebox.showinfo("Success", "Tile data generated successfully.")
+        elif not isinstance(error, JobCancelled):
             messagebox.showerror("Error", "Failed to generate tile data.")
 
+    def _submit_job(self, image_name, kind, run, on_complete):
+        # Callbacks arrive on the inference worker and are moved to the Tk thread
+        try:
+            self.scheduler.submit(
+                image_name, kind, run,
+                on_progress=lambda job, stage, fraction: self.after(0, lambda: self._on_job_progress(job, stage, fraction)),
+                on_done=lambda job, result, error: self.after(0, lambda: on_complete(job, result, error)),
+            )
+        except queue.Full:
+            messagebox.showwarning("Busy", "Too many inference jobs are queued. Try again when some have finished.")
+            return False
+        self._update_job_buttons()
+        return True
+
+    def _on_job_progress(self, job, stage, fraction):
+        if job.image_id != self.current_image_name or job.cancelled:
+            return
+        text = f"{stage}... ({fraction:.0%})" if fraction is not None else f"{stage}..."
+        label = self.lbl_gen_status if job.kind == "generate" else self.lbl_analysis_status
+        label.configure(text=text, text_color="blue")
+
+    def _update_job_buttons(self):
+        # Buttons turn into cancel buttons while the shown image has a job
+        if self.scheduler.find(self.current_image_name, "analyze"):
+            self.btn_analyze.configure(state="normal", text="Cancel Analysis", command=self.cancel_analysis)
+        else:
+            self.btn_analyze.configure(state="normal", text="Get Relevant Labels", command=self.analyze_image)
+
+        if self.scheduler.find(self.current_image_name, "generate"):
+            self.btn_generate_tiles.configure(state="normal", text="Cancel Generation", command=self.cancel_generation)
+        else:
+            self.btn_generate_tiles.configure(text="Generate Tile Data", command=self.generate_tile_data)
+
+    def cancel_analysis(self):
+        self.scheduler.cancel(self.current_image_name, "analyze")
+        self.lbl_analysis_status.configure(text="Cancelling...", text_color="gray")
+
+    def cancel_generation(self):
+        self.scheduler.cancel(self.current_image_name, "generate")
+        self.lbl_gen_status.configure(text="Cancelling...", text_color="gray")
+
+    def _decoded_image(self, image_name):
+        # One handle per image, shared by analysis and generation. It wraps the
+        # blob file, so the bytes are read and decoded (at most once) by the
+        # worker thread.
+        img_model = self.db.get_image(image_name)
+        key = (image_name, getattr(img_model, 'data_hash', None))
+        if self._decoded is None or self._decoded[0] != key:
+            self._decoded = (key, DecodedImage(self.db.get_image_file(image_name), name=image_name))
+        return self._decoded[1]
+
     def analyze_image(self):
         try:
             top_k = int(self.entry_top_k.get())
@@ -550,37 +560,60 @@ class DetailView(ctk.CTkFrame):
             if not messagebox.askyesno("Confirm Analysis", msg):
                 return
 
-        self.btn_analyze.configure(state="disabled", text="Analyzing (Loading Model)...")
-        self.update_idletasks()
-
-        threading.Thread(target=self._run_analysis_thread, args=(top_k, threshold, prompt)).start()
+        image_name = self.current_image_name
+        label_names = [l.name for l in self.db.get_all_labels()]
+        config = {"top_k": top_k, "threshold": threshold, "prompt": prompt}
 
-    def _run_analysis_thread(self, top_k, threshold, prompt):
-        all_labels = self.db.get_all_labels()
-        label_names = [l.name for l in all_labels]
-        
-        img_model = self.db.get_image(self.current_image_name)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-            tmp.write(img_model.data)
-            tmp_path = tmp.name
+        # As with generation, the feature id may come from the inference server
+        if self._submit_job(image_name, "analyze", lambda job: self.label_selector.feature_id,
+                            lambda job, model_id, error: self._start_analysis(job, model_id, error, label_names,
+                                                                              config)):
+            self.lbl_analysis_status.configure(text="Queued...", text_color="blue")
 
-        try:
-            final_labels = self.label_selector.analyze(tmp_path, label_names, prompt, top_k, threshold)
-        except Exception as e:
-            print(f"Analysis Error: {e}")
-            final_labels = []
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+    def _start_analysis(self, job, model_id, error, label_names, config):
+        image_name = job.image_id
+        if error is not None or job.cancelled or not self.db.get_image(image_name):
+            self._on_analysis_complete(job, None, error or JobCancelled(), config, model_id, None, None)
+            return
 
-        config = {"top_k": top_k, "threshold": threshold, "prompt": prompt}
-        self.after(0, lambda: self._on_analysis_complete(final_labels, config))
+        prompt = config["prompt"]
+        text_cache = self.db.get_text_feature_cache(model_id, prompt)
+        image_cache = self.db.get_image_feature_cache(image_name, model_id)
+        image = self._decoded_image(image_name)
+
+        def run(job):
+            return self.label_selector.analyze(image, label_names, prompt, config["top_k"], config["threshold"],
+                                               text_cache=text_cache, image_cache=image_cache,
+                                               progress=job.progress)
+
+        if not self._submit_job(image_name, "analyze", run,
+                                lambda job, result, error: self._on_analysis_complete(job, result, error, config,
+                                                                                      model_id, text_cache,
+                                                                                      image_cache)):
+            self._on_analysis_complete(job, None, JobCancelled(), config, model_id, None, None)
+
+    def _on_analysis_complete(self, job, final_labels, error, config, model_id, text_cache, image_cache):
+        image_name = job.image_id
+        if error is None:
+            self.db.store_text_features(model_id, config["prompt"], text_cache)
+            self.db.store_image_features(image_name, model_id, image_cache)
+            self.db.update_image_analysis(image_name, final_labels, config)
+        elif not isinstance(error, JobCancelled):
+            print(f"Analysis Error: {error}")
+
+        # Results for an image that is no longer shown are only stored
+        if image_name != self.current_image_name:
+            return
 
-    def _on_analysis_complete(self, final_labels, config):
-        self.db.update_image_analysis(self.current_image_name, final_labels, config)
-        self.display_results(final_labels)
-        self.update_gen_tab_state()
-        self.btn_analyze.configure(state="normal", text="Get Relevant Labels")
+        if error is None:
+            self.lbl_analysis_status.configure(text="")
+            self.display_results(final_labels)
+            self.update_gen_tab_state()
+        elif isinstance(error, JobCancelled):
+            self.lbl_analysis_status.configure(text="Analysis cancelled.", text_color="gray")
+        else:
+            self.lbl_analysis_status.configure(text="Analysis failed.", text_color="red")
+        self._update_job_buttons()
 
     def display_results(self, labels):
         for widget in self.results_frame.winfo_children():
@@ -602,6 +635,7 @@ class DetailView(ctk.CTkFrame):
         if not self.current_image_name: return
         
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{self.current_image_name}'?"):
+            self.scheduler.cancel(self.current_image_name)
             if self.db.delete_image(self.current_image_name):
                 self.on_back()
             else:
@@ -619,23 +653,7 @@ class DetailView(ctk.CTkFrame):
         try:
             import json
             
-            all_labels = self.db.get_all_labels()
-            label_configs = [{"name": l.name, "walkable": l.walkable, "slope_tolerance": l.slope_tolerance} for l in all_labels]
-            
-            raw_tiles = img_model.tile_data.get('data', [])
-            clean_tiles = []
-            for t in raw_tiles:
-                clean_tiles.append({
-                    "grid_pos": t.get("grid_pos"),
-                    "composition": t.get("composition"),
-                    "slope_val": t.get("slope_val")
-                })
-
-            export_data = {
-                "config": img_model.tile_data.get('config', ""),
-                "labels": label_configs,
-                "tiles": clean_tiles
-            }
+            export_data = build_tile_export(img_model.tile_data, self.db.get_all_labels())
             
             with open(file_path, 'w') as f:
                 json.dump(export_data, f, indent=4)
@@ -1,13 +1,32 @@
 import customtkinter as ctk
-from tkinter import filedialog
+from tkinter import filedialog, messagebox
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import queue
 import io
+import os
+from ml.image_io import DecodedImage
+from ml.job_scheduler import BATCH, JobCancelled
 
 class GalleryTab(ctk.CTkFrame):
-    def __init__(self, parent, db, on_image_click: callable):
+    COLUMNS = 4
+    ROW_HEIGHT = 230        # thumbnail button plus the name and indicator labels
+    DECODE_WORKERS = 2
+    APPLY_BATCH = 16        # decoded thumbnails handed to Tk per tick
+    POLL_MS = 50
+    THUMBNAIL_CACHE = 128   # decoded thumbnails kept for scrolling back
+    # The detail view's default analysis settings
+    LABEL_CONFIG = {"top_k": 5, "threshold": 0.2, "prompt": "a top-down rpg map texture of {}"}
+
+    def __init__(self, parent, db, on_image_click: callable, models, scheduler):
         super().__init__(parent)
         self.db = db
         self.on_image_click = on_image_click
+        self.models = models
+        self.scheduler = scheduler
+        self._unlabeled = []
+        self._label_job = None
 
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
@@ -15,57 +34,281 @@ class GalleryTab(ctk.CTkFrame):
         # Sidebar
         self.sidebar = ctk.CTkFrame(self, width=200, corner_radius=0)
         self.sidebar.grid(row=0, column=0, sticky="nsew")
-        
+
         self.upload_button = ctk.CTkButton(self.sidebar, text="Upload Image", command=self.upload_image)
         self.upload_button.grid(row=0, column=0, padx=20, pady=20)
 
+        self.label_button = ctk.CTkButton(self.sidebar, text="Label Unlabeled", command=self.label_unlabeled)
+        self.label_button.grid(row=1, column=0, padx=20)
+        self.lbl_label_status = ctk.CTkLabel(self.sidebar, text="", font=ctk.CTkFont(size=11), text_color="gray")
+        self.lbl_label_status.grid(row=2, column=0, padx=20)
+
         # Gallery Area
-        self.gallery_frame = ctk.CTkScrollableFrame(self, label_text="My Collection")
+        self.gallery_frame = ctk.CTkFrame(self)
         self.gallery_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
-        self.gallery_frame.grid_columnconfigure((0, 1, 2), weight=1)
+        self.gallery_frame.grid_columnconfigure(0, weight=1)
+        self.gallery_frame.grid_rowconfigure(1, weight=1)
+        ctk.CTkLabel(self.gallery_frame, text="My Collection").grid(row=0, column=0, columnspan=2, pady=(5, 0))
+
+        # Only the rows in view have widgets: a fixed pool of cells is
+        # reassigned to other images as the collection scrolls past it
+        self.cells_frame = ctk.CTkFrame(self.gallery_frame, fg_color="transparent")
+        self.cells_frame.grid(row=1, column=0, sticky="nsew")
+        self.cells_frame.grid_propagate(False)
+        self.cells_frame.grid_columnconfigure(tuple(range(self.COLUMNS)), weight=1)
+        self.scrollbar = ctk.CTkScrollbar(self.gallery_frame, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+
+        self.cells = []
+        self.order = []
+        self.first_row = 0
+        self.visible_rows = 1
+        self.thumbnails = OrderedDict()     # thumb key -> CTkImage
+        # Shown by a reassigned cell until its own thumbnail is decoded
+        blank = Image.new("RGBA", (150, 150), (0, 0, 0, 0))
+        self.placeholder = ctk.CTkImage(light_image=blank, dark_image=blank, size=blank.size)
+
+        # Thumbnails are decoded off the Tk thread and applied in batches
+        self.decoder = ThreadPoolExecutor(max_workers=self.DECODE_WORKERS, thread_name_prefix="thumbnails")
+        self.decoded = queue.Queue()
+
+        self.cells_frame.bind("<Configure>", self._on_resize)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_all(sequence, self._on_mouse_wheel, add=True)
 
         self.load_images()
+        self.after(self.POLL_MS, self._apply_decoded)
 
     def upload_image(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")])
-        if file_path:
-            self.db.add_image(file_path)
-            self.load_images()
+        file_paths = filedialog.askopenfilenames(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp;*.gif")])
+        if not file_paths:
+            return
+        skipped = []
+        for file_path in file_paths:
+            try:
+                self.db.add_image(file_path)
+            except OSError as e:
+                # Unreadable or not an image (PIL's UnidentifiedImageError is an OSError)
+                print(f"Skipped {file_path}: {e}")
+                skipped.append(os.path.basename(file_path))
+        self.load_images()
+        if skipped:
+            messagebox.showwarning("Upload", "These files could not be read as images and were skipped:\n"
+                                   + "\n".join(skipped))
+
+    def label_unlabeled(self):
+        # Analyzes every image without labels as batch-priority jobs, one at a
+        # time, so jobs started from the detail view go ahead of the rest
+        self._unlabeled = [name for name in self.db.get_image_names()
+                           if not self.db.get_image(name).relevant_labels]
+        if not self._unlabeled:
+            messagebox.showinfo("Label", "Every image already has labels.")
+            return
+        self.label_button.configure(text="Stop Labeling", command=self.stop_labeling)
+        self._label_next()
+
+    def stop_labeling(self):
+        self._unlabeled = []
+        if self._label_job is not None:
+            self._label_job.cancel()
+        self.lbl_label_status.configure(text="Stopping...")
+
+    def _label_next(self):
+        self._label_job = None
+        while self._unlabeled:
+            name = self._unlabeled.pop(0)
+            img_model = self.db.get_image(name)
+            # Deleted or labeled from the detail view since the run started
+            if img_model is None or img_model.relevant_labels:
+                continue
+            self.lbl_label_status.configure(text=f"Labeling {name} ({len(self._unlabeled)} left)")
+            # As in the detail view, the feature id may come from the inference server
+            if self._submit_label_job(name, lambda job: self.models.label_selector.feature_id,
+                                      self._start_labeling):
+                return
+        self.label_button.configure(text="Label Unlabeled", command=self.label_unlabeled)
+        self.lbl_label_status.configure(text="")
+
+    def _submit_label_job(self, name, run, then):
+        # then(job, result) runs on the Tk thread once the job succeeds
+        def on_done(job, result, error):
+            self.after(0, lambda: self._on_label_job_done(job, result, error, then))
+        try:
+            self._label_job = self.scheduler.submit(name, "analyze", run, priority=BATCH, on_done=on_done)
+        except queue.Full:
+            self._unlabeled = []
+            messagebox.showwarning("Busy", "Too many inference jobs are queued. Labeling stopped.")
+            return False
+        return True
+
+    def _on_label_job_done(self, job, result, error, then):
+        if error is None:
+            then(job, result)
+            return
+        if not isinstance(error, JobCancelled):
+            print(f"Labeling Error ({job.image_id}): {error}")
+        self._label_next()
+
+    def _start_labeling(self, job, model_id):
+        name = job.image_id
+        if not self.db.get_image(name):
+            self._label_next()
+            return
+        config = dict(self.LABEL_CONFIG)
+        label_names = [l.name for l in self.db.get_all_labels()]
+        text_cache = self.db.get_text_feature_cache(model_id, config["prompt"])
+        image_cache = self.db.get_image_feature_cache(name, model_id)
+        image = DecodedImage(self.db.get_image_file(name), name=name)
+
+        def run(job):
+            return self.models.label_selector.analyze(image, label_names, config["prompt"], config["top_k"],
+                                                      config["threshold"], text_cache=text_cache,
+                                                      image_cache=image_cache, progress=job.progress)
+
+        def store(job, labels):
+            self.db.store_text_features(model_id, config["prompt"], text_cache)
+            self.db.store_image_features(name, model_id, image_cache)
+            img_model = self.db.get_image(name)
+            # Labels set from the detail view meanwhile are not overwritten
+            if img_model is not None and not img_model.relevant_labels:
+                self.db.update_image_analysis(name, labels, config)
+                self._show_rows()
+            self._label_next()
+
+        if not self._submit_label_job(name, run, store):
+            self._label_next()
 
     def load_images(self):
-        for widget in self.gallery_frame.winfo_children():
-            widget.destroy()
+        self.order = self.db.get_image_names()
+        self._show_rows()
 
-        images = self.db.get_all_images()
-        row, col = 0, 0
-        for img_model in images:
+    def _total_rows(self):
+        return -(-len(self.order) // self.COLUMNS)
+
+    def _on_resize(self, event):
+        visible_rows = max(1, event.height // self.ROW_HEIGHT)
+        if visible_rows != self.visible_rows or not self.cells:
+            self.visible_rows = visible_rows
+            self._show_rows()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.first_row = round(float(value) * self._total_rows())
+        else:
+            # One row per wheel step, a screenful per page
+            step = self.visible_rows if unit == "pages" else 1
+            self.first_row += step if int(value) > 0 else -step
+        self._show_rows()
+
+    def _on_mouse_wheel(self, event):
+        # Bound application-wide (as CTkScrollableFrame does), so only act
+        # for events over the cells
+        if not str(event.widget).startswith(str(self.cells_frame)):
+            return
+        if event.num == 4 or event.num == 5:
+            value = -1 if event.num == 4 else 1
+        else:
+            value = -event.delta
+        if value:
+            self._on_scrollbar("scroll", value, "units")
+
+    def _show_rows(self):
+        total_rows = self._total_rows()
+        self.first_row = max(0, min(self.first_row, total_rows - self.visible_rows))
+
+        while len(self.cells) < self.visible_rows * self.COLUMNS:
+            self.cells.append(self._create_cell())
+
+        for i, cell in enumerate(self.cells):
+            index = self.first_row * self.COLUMNS + i
+            if i < self.visible_rows * self.COLUMNS and index < len(self.order):
+                try:
+                    self._update_cell(cell, self.db.get_image(self.order[index]), divmod(i, self.COLUMNS))
+                except Exception as e:
+                    print(f"Error loading image: {e}")
+            elif cell["name"] is not None:
+                cell["frame"].grid_remove()
+                cell["name"] = cell["position"] = None
+
+        if total_rows:
+            self.scrollbar.set(self.first_row / total_rows, min(1.0, (self.first_row + self.visible_rows) / total_rows))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _create_cell(self):
+        frame = ctk.CTkFrame(self.cells_frame, fg_color="transparent")
+        cell = {"frame": frame, "name": None, "position": None, "state": None, "thumb_key": None}
+
+        # Clickable Frame
+        cell["button"] = ctk.CTkButton(frame, text="", width=150, height=150,
+                                       fg_color="transparent", hover_color="gray",
+                                       command=lambda: cell["name"] and self.on_image_click(cell["name"]))
+        cell["button"].pack(padx=10, pady=10)
+
+        cell["lbl_name"] = ctk.CTkLabel(frame, text="", font=ctk.CTkFont(size=12))
+        cell["lbl_name"].pack()
+        cell["lbl_labels"] = ctk.CTkLabel(frame, text="", font=ctk.CTkFont(size=10))
+        cell["lbl_labels"].pack()
+        cell["lbl_tiles"] = ctk.CTkLabel(frame, text="", font=ctk.CTkFont(size=10))
+        cell["lbl_tiles"].pack()
+        return cell
+
+    def _update_cell(self, cell, img_model, position):
+        # Reconfigures only what differs from what the cell already shows
+        if cell["position"] != position:
+            cell["frame"].grid(row=position[0], column=position[1])
+            cell["position"] = position
+
+        if cell["name"] != img_model.name:
+            cell["lbl_name"].configure(text=img_model.name)
+            cell["name"] = img_model.name
+
+        # Indicators
+        state = (bool(getattr(img_model, 'relevant_labels', None)), bool(getattr(img_model, 'tile_data', None)))
+        if cell["state"] != state:
+            has_labels, has_tiles = state
+            cell["lbl_labels"].configure(text="Labels: YES" if has_labels else "Labels: NO",
+                                         text_color="green" if has_labels else "gray")
+            cell["lbl_tiles"].configure(text="Tiles: YES" if has_tiles else "Tiles: NO",
+                                        text_color="green" if has_tiles else "gray")
+            cell["state"] = state
+
+        thumb_key = getattr(img_model, 'data_hash', None) or img_model.name
+        if cell["thumb_key"] != thumb_key:
+            cell["thumb_key"] = thumb_key
+            image = self.thumbnails.get(thumb_key)
+            if image is None:
+                cell["button"].configure(image=self.placeholder)
+                thumbnail = self.db.get_thumbnail(img_model.name, 150)
+                self.decoder.submit(self._decode_thumbnail, thumb_key, thumbnail)
+            else:
+                cell["button"].configure(image=image)
+                self.thumbnails.move_to_end(thumb_key)
+
+    def _decode_thumbnail(self, thumb_key, thumbnail):
+        try:
+            pil_image = Image.open(io.BytesIO(thumbnail))
+            pil_image.load()
+            self.decoded.put((thumb_key, pil_image))
+        except Exception as e:
+            print(f"Error loading image: {e}")
+
+    def _apply_decoded(self):
+        for _ in range(self.APPLY_BATCH):
             try:
-                image_data = io.BytesIO(img_model.data)
-                pil_image = Image.open(image_data)
-                pil_image.thumbnail((150, 150))
-                ctk_image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=pil_image.size)
-                
-                # Clickable Frame
-                item_frame = ctk.CTkButton(self.gallery_frame, text="", image=ctk_image, 
-                                           fg_color="transparent", hover_color="gray",
-                                           command=lambda n=img_model.name: self.on_image_click(n))
-                item_frame.grid(row=row, column=col, padx=10, pady=10)
-                
-                ctk.CTkLabel(self.gallery_frame, text=img_model.name, font=ctk.CTkFont(size=12)).grid(row=row+1, column=col)
-                
-                # Indicators
-                has_labels = "Labels: YES" if getattr(img_model, 'relevant_labels', None) else "Labels: NO"
-                has_tiles = "Tiles: YES" if getattr(img_model, 'tile_data', None) else "Tiles: NO"
-                
-                lbl_color = "green" if getattr(img_model, 'relevant_labels', None) else "gray"
-                tile_color = "green" if getattr(img_model, 'tile_data', None) else "gray"
-
-                ctk.CTkLabel(self.gallery_frame, text=has_labels, font=ctk.CTkFont(size=10), text_color=lbl_color).grid(row=row+2, column=col)
-                ctk.CTkLabel(self.gallery_frame, text=has_tiles, font=ctk.CTkFont(size=10), text_color=tile_color).grid(row=row+3, column=col)
-
-                col += 1
-                if col > 3:
-                    col = 0
-                    row += 4 
-            except Exception as e:
-                print(f"Error loading image: {e}")
+                thumb_key, pil_image = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+            image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=pil_image.size)
+            self.thumbnails[thumb_key] = image
+            if len(self.thumbnails) > self.THUMBNAIL_CACHE:
+                self.thumbnails.popitem(last=False)
+            # Cells scrolled on to other images while decoding are skipped
+            for cell in self.cells:
+                if cell["thumb_key"] == thumb_key:
+                    cell["button"].configure(image=image)
+        self.after(self.POLL_MS, self._apply_decoded)
+
+    def destroy(self):
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
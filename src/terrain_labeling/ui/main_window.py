@@ -1,24 +1,33 @@
 import customtkinter as ctk
+import os
+import time
 from core.database import Database
 from ui.gallery_tab import GalleryTab
 from ui.labels_tab import LabelsTab
+from ui.stats_tab import StatsTab
 from ui.detail_view import DetailView
-from ml.label_selector import LabelSelector
-from ml.tile_generator import TileGenerator
+from ml.model_loader import ModelLoader
+from ml.job_scheduler import JobScheduler
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
 class MainWindow(ctk.CTk):
-    def __init__(self):
+    def __init__(self, start_time=None):
         super().__init__()
 
         self.title("2D Map Terrain Labeler")
         self.geometry("1000x700")
 
         self.db = Database()
-        self.label_selector = LabelSelector() # Singleton lazy init
-        self.tile_generator = TileGenerator() # Singleton lazy init
+        # Client mode (TERRAIN_INFERENCE_URL): models stay resident in a shared inference server
+        self.models = ModelLoader(os.environ.get("TERRAIN_INFERENCE_URL"))
+        # Analysis/generation jobs share the models through one queue; more
+        # workers only help when cores outnumber what one job can use, so
+        # they split the torch threads between them
+        workers = int(os.environ.get("TERRAIN_INFERENCE_WORKERS", "1"))
+        threads = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None
+        self.scheduler = JobScheduler(workers=workers, threads_per_worker=threads)
 
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(0, weight=1)
@@ -31,11 +40,26 @@ class MainWindow(ctk.CTk):
 
         # Views
         self.main_view = ctk.CTkFrame(self.container)
-        self.detail_view = DetailView(self.container, self.db, self.show_main_view, self.label_selector, self.tile_generator)
+        self.detail_view = DetailView(self.container, self.db, self.show_main_view, self.models, self.scheduler)
 
         self.setup_main_view()
         self.show_main_view()
 
+        # Status Bar
+        self.lbl_model_status = ctk.CTkLabel(self, text="Models load on first use", anchor="w",
+                                             font=ctk.CTkFont(size=11), text_color="gray")
+        self.lbl_model_status.grid(row=1, column=0, padx=10, sticky="ew")
+
+        if start_time is not None:
+            self.after_idle(lambda: print(f"Window ready in {time.perf_counter() - start_time:.2f}s"))
+
+        if os.environ.get("TERRAIN_WARMUP", "1") != "0":
+            self.models.warm_up(lambda text, state: self.after(0, lambda: self._set_model_status(text, state)))
+
+    def _set_model_status(self, text, state):
+        colors = {"loading": "gray", "ready": "green", "error": "red"}
+        self.lbl_model_status.configure(text=text, text_color=colors[state])
+
     def setup_main_view(self):
         self.main_view.grid_columnconfigure(0, weight=1)
         self.main_view.grid_rowconfigure(0, weight=1)
@@ -45,14 +69,18 @@ class MainWindow(ctk.CTk):
         
         self.tab_gallery = self.tabview.add("Gallery")
         self.tab_labels = self.tabview.add("Labels")
+        self.tab_stats = self.tabview.add("Performance")
 
         # Initialize Tabs
-        self.gallery_tab = GalleryTab(self.tab_gallery, self.db, self.show_detail_view)
+        self.gallery_tab = GalleryTab(self.tab_gallery, self.db, self.show_detail_view, self.models, self.scheduler)
         self.gallery_tab.pack(fill="both", expand=True)
 
         self.labels_tab = LabelsTab(self.tab_labels, self.db)
         self.labels_tab.pack(fill="both", expand=True)
 
+        self.stats_tab = StatsTab(self.tab_stats)
+        self.stats_tab.pack(fill="both", expand=True)
+
     def show_main_view(self):
         self.detail_view.grid_forget()
         self.main_view.grid(row=0, column=0, sticky="nsew")
@@ -64,5 +92,6 @@ class MainWindow(ctk.CTk):
         self.detail_view.load_image(image_name)
 
     def on_closing(self):
+        self.scheduler.shutdown()
         self.db.close()
         self.destroy()
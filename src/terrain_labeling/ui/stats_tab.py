@@ -0,0 +1,64 @@
+import customtkinter as ctk
+from tkinter import filedialog
+from core.profiling import tracer
+
+class StatsTab(ctk.CTkFrame):
+    REFRESH_MS = 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        self.controls_frame = ctk.CTkFrame(self)
+        self.controls_frame.grid(row=0, column=0, padx=20, pady=10, sticky="ew")
+
+        ctk.CTkButton(self.controls_frame, text="Export JSON", command=self.export_json).pack(side="left", padx=10)
+        ctk.CTkButton(self.controls_frame, text="Export Chrome Trace", command=self.export_chrome_trace).pack(side="left", padx=10)
+        ctk.CTkButton(self.controls_frame, text="Clear", command=self.clear).pack(side="left", padx=10)
+
+        self.lbl_status = ctk.CTkLabel(self.controls_frame, text="", text_color="gray")
+        self.lbl_status.pack(side="left", padx=10)
+
+        self.text_stats = ctk.CTkTextbox(self, font=ctk.CTkFont(family="Courier", size=12))
+        self.text_stats.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
+
+        self.refresh()
+
+    def refresh(self):
+        # Only redraw while the tab is on screen; the timer keeps running either way
+        if self.winfo_ismapped():
+            self.text_stats.configure(state="normal")
+            self.text_stats.delete("1.0", "end")
+            self.text_stats.insert("1.0", self.format_stats(tracer.stats()))
+            self.text_stats.configure(state="disabled")
+        self.after(self.REFRESH_MS, self.refresh)
+
+    @staticmethod
+    def format_stats(stats):
+        if not tracer.enabled:
+            return "Tracing is disabled (TERRAIN_TRACE=0)."
+        if not stats:
+            return "No spans recorded yet. Analyze or generate a map to collect timings."
+        lines = [f"{'Span':<28}{'Count':>7}{'Mean ms':>11}{'Max ms':>11}{'Last ms':>11}{'Total ms':>12}"]
+        for name, entry in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name:<28}{entry['count']:>7}{entry['mean_ms']:>11.1f}{entry['max_ms']:>11.1f}"
+                         f"{entry['last_ms']:>11.1f}{entry['total_ms']:>12.1f}")
+        return "\n".join(lines)
+
+    def export_json(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        if file_path:
+            tracer.export_json(file_path)
+            self.lbl_status.configure(text=f"Saved {file_path}")
+
+    def export_chrome_trace(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        if file_path:
+            tracer.export_chrome_trace(file_path)
+            self.lbl_status.configure(text=f"Saved {file_path} (open in chrome://tracing or Perfetto)")
+
+    def clear(self):
+        tracer.clear()
+        self.lbl_status.configure(text="")
@@ -0,0 +1,89 @@
+from PIL import ImageDraw
+
+from core.models import BLOCK_REASONS
+
+class TilePreviewRenderer:
+    # Renders the Tile Data Preview. The walkability overlay for the current
+    # image is drawn once per (threshold, label-config version) and cached, so
+    # hovering only copies it and draws the highlight rectangle.
+    def __init__(self, evaluate_grid):
+        self.evaluate_grid = evaluate_grid
+        self.reset(None, None)
+
+    def reset(self, base_image, grid):
+        self.base_image = base_image
+        self.grid = grid
+        self._overlay = None
+        self._overlay_key = None
+        self._status = None
+
+    def tile_at(self, x, y):
+        # Maps preview pixel coordinates to a clamped (row, col)
+        rows, cols = self.grid.shape
+        w, h = self.base_image.size
+        col = max(0, min(int(x // (w / cols)), cols - 1))
+        row = max(0, min(int(y // (h / rows)), rows - 1))
+        return row, col
+
+    def render(self, threshold, label_configs, config_version, highlight=None):
+        key = (threshold, config_version)
+        if self._overlay_key != key:
+            self._overlay = self._render_overlay(threshold, label_configs)
+            self._overlay_key = key
+
+        if highlight is None:
+            return self._overlay
+
+        image = self._overlay.copy()
+        draw = ImageDraw.Draw(image, "RGBA")
+        tile_w, tile_h = self._tile_size()
+        row, col = highlight
+        hx, hy = col * tile_w, row * tile_h
+        draw.rectangle([hx, hy, hx + tile_w, hy + tile_h], fill=(255, 255, 255, 100))
+        return image
+
+    def _tile_size(self):
+        rows, cols = self.grid.shape
+        w, h = self.base_image.size
+        return w / cols, h / rows
+
+    def tile_status(self, row, col):
+        # (walkable, block reason, dominant label) from the last render
+        walkable, block_reason, dominant = self._status
+        dominant_idx = int(dominant[row, col])
+        return (bool(walkable[row, col]), BLOCK_REASONS[block_reason[row, col]],
+                self.grid.labels[dominant_idx] if dominant_idx >= 0 else "none")
+
+    def _render_overlay(self, threshold, label_configs):
+        # The stored slopes, as generation evaluated them
+        self._status = self.evaluate_grid(self.grid.composition, self.grid.slope, self.grid.labels, label_configs,
+                                          threshold)
+        walkable, block_reason, _ = self._status
+
+        image = self.base_image.copy()
+        draw = ImageDraw.Draw(image, "RGBA")
+        tile_w, tile_h = self._tile_size()
+
+        rows, cols = self.grid.shape
+        for r in range(rows):
+            for c in range(cols):
+                self._draw_tile_overlay(draw, c * tile_w, r * tile_h, tile_w, tile_h,
+                                        walkable[r, c], BLOCK_REASONS[block_reason[r, c]])
+
+        return image
+
+    @staticmethod
+    def _draw_tile_overlay(draw, x, y, tile_w, tile_h, walkable, reason):
+        if not walkable:
+            if reason == "steep_slope":
+                color = "red"
+                width = 2
+                draw.line([x, y, x + tile_w, y + tile_h], fill=color, width=width)
+                draw.line([x, y + tile_h, x + tile_w, y], fill=color, width=width)
+            else:
+                color = "orange"
+                width = 2
+                draw.rectangle([x, y, x + tile_w, y + tile_h], outline=color, width=width)
+                draw.line([x, y, x + tile_w, y + tile_h], fill=color, width=width)
+        else:
+            draw.rectangle([x, y, x + tile_w, y + tile_h], outline="#00FF00", width=1)